@@ -6,11 +6,16 @@ Architecture: Work Mac (client) -> Raspberry Pi (server)
 """
 
 import argparse
+import hashlib
+import hmac
 import os
 import re
+import socket
 import sys
 import time
-from datetime import datetime
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from glob import glob
 from typing import Optional
 import json
@@ -78,13 +83,186 @@ STATUS_DISPLAY_COLOR = {
     "Unknown": "White",
 }
 
+# Seconds a new status must hold before it is pushed (debounce); statuses not
+# listed are pushed as soon as they are seen
+DEFAULT_DWELL = {
+    "Available": 0,
+    "Busy": 10,
+    "Away": 30,
+    "BeRightBack": 30,
+    "Offline": 60,
+    "Unknown": 60,
+}
+# Always pushed immediately, whatever their dwell time
+IMMEDIATE_STATUSES = ("InAMeeting", "InACall", "DoNotDisturb")
+
+MAX_BACKFILL = 500  # Missed transitions sent to the Pi in one request
+
+# Warm-start checkpoint: log position, last status and last acked push
+DEFAULT_CHECKPOINT = os.path.expanduser("~/.teams_push_checkpoint.json")
+CHECKPOINT_INTERVAL = 60  # Seconds between writes when only the log offset moved
+
+# Rotated New Teams logs searched when the current one has no status yet
+MAX_LOG_FILES = 10
+PARALLEL_SCAN_BYTES = 8 * 1024 * 1024  # Unscanned bytes above which rotated files are read in parallel
+SCAN_THREADS = 3
+
+# ============================================================================
+# LOG PARSING PIPELINE
+# ============================================================================
+
+STATUS_LINE_PATTERN = re.compile(
+    r"UserDataCrossCloudModule|UserPresenceAction|SetBadge.*status|"
+    r"StatusIndicatorStateService|NewActivity"
+)
+# New Teams: "2024-01-15T10:30:00.123456+01:00 0x..."; classic: "Mon Jan 15 2024 10:30:00 GMT+0100 (...)"
+ISO_TIMESTAMP = re.compile(r"^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:[.,]\d+)?(Z|[+-]\d{2}:?\d{2})?")
+CLASSIC_TIMESTAMP = re.compile(r"^\w{3} (\w{3} \d{1,2} \d{4} \d{2}:\d{2}:\d{2}) GMT([+-]\d{4})")
+
+
+def status_from_line(line: str) -> Optional[str]:
+    """Availability reported by one log line, or None."""
+    match = re.search(
+        r"availability:\s*(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,}]",
+        line
+    )
+    if match:
+        return match.group(1)
+
+    match = re.search(
+        r"status\s+(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,]",
+        line
+    )
+    if match:
+        return match.group(1)
+
+    match = re.search(
+        r"Setting the taskbar overlay icon - (Available|Away)|"
+        r"NewActivity: (Available|Away)",
+        line
+    )
+    if match:
+        return match.group(1) or match.group(2)
+
+    match = re.search(r"NewActivity: (InAMeeting|InACall|Busy)", line)
+    if match:
+        return match.group(1)
+
+    if "NewActivity: BeRightBack" in line:
+        return "BeRightBack"
+
+    match = re.search(r"NewActivity: (DoNotDisturb|Presenting)", line)
+    if match:
+        return "DoNotDisturb"
+
+    if "NewActivity: Offline" in line:
+        return "Offline"
+
+    return None
+
+
+def log_timestamp(line: str) -> Optional[str]:
+    """ISO time (with UTC offset when the log has one) a log line was written, or None."""
+    try:
+        match = ISO_TIMESTAMP.match(line)
+        if match:
+            date, clock, offset = match.groups()
+            moment = datetime.fromisoformat(f"{date}T{clock}")
+            if offset:
+                offset = "+00:00" if offset == "Z" else offset
+                moment = datetime.strptime(f"{date}T{clock}{offset.replace(':', '')}", "%Y-%m-%dT%H:%M:%S%z")
+            return moment.isoformat()
+        match = CLASSIC_TIMESTAMP.match(line)
+        if match:
+            return datetime.strptime(f"{match.group(1)} {match.group(2)}", "%b %d %Y %H:%M:%S %z").isoformat()
+    except ValueError:
+        pass
+    return None
+
+
+def iter_transitions(lines, previous: Optional[str] = None):
+    """Yield (log time, status) for every status change in a stream of log lines.
+
+    Lazily consumes lines, so it can run over a whole log or just the lines
+    appended since the last poll; previous is the status before them.
+    """
+    for line in lines:
+        if not STATUS_LINE_PATTERN.search(line):
+            continue
+        status = status_from_line(line)
+        if status and status != previous:
+            yield log_timestamp(line), status
+            previous = status
+
+
+class StatusDebouncer:
+    """Holds back short-lived status flips between polling and pushing.
+
+    Teams flips briefly while locking the screen (Available -> Away ->
+    Available) or ending a call (InACall -> Busy -> Available). A new status
+    is only passed on once it has been seen for its dwell time; a status
+    that reverts or is replaced first is counted as suppressed.
+    """
+
+    def __init__(self, dwell: dict, immediate: tuple = IMMEDIATE_STATUSES):
+        self.dwell = dwell
+        self.immediate = immediate
+        self.stable: Optional[str] = None
+        self.candidate: Optional[str] = None
+        self.candidate_since = 0.0
+        self.pushed = 0
+        self.suppressed = 0
+
+    def update(self, status: str, now: float) -> Optional[str]:
+        """Feed one polled status; returns it once it should be pushed, else None."""
+        if status == self.stable:
+            if self.candidate is not None:
+                self.suppressed += 1
+                self.candidate = None
+            return None
+        if status != self.candidate:
+            if self.candidate is not None:
+                self.suppressed += 1
+            self.candidate = status
+            self.candidate_since = now
+        if (self.stable is None or status in self.immediate or
+                now - self.candidate_since >= self.dwell.get(status, 0)):
+            self.stable = status
+            self.candidate = None
+            self.pushed += 1
+            return status
+        return None
+
 
 class TeamsPushClient:
-    def __init__(self, raspberry_pi_ip: str, port: int, poll_interval: int, verbose: bool):
+    def __init__(self, raspberry_pi_ip: str, port: int, poll_interval: int, verbose: bool,
+                 user_id: Optional[str] = None, device_id: Optional[str] = None,
+                 heartbeat: int = 60, udp_port: int = 0, udp_key: str = "",
+                 dwell: Optional[dict] = None, checkpoint_path: Optional[str] = DEFAULT_CHECKPOINT):
         self.raspberry_pi_ip = raspberry_pi_ip
         self.port = port
         self.poll_interval = poll_interval
         self.verbose = verbose
+        self.user_id = user_id
+        self.device_id = device_id or socket.gethostname()
+        self.heartbeat = heartbeat
+        self.debouncer = StatusDebouncer(DEFAULT_DWELL if dwell is None else dwell)
+        self.udp_port = udp_port
+        self.udp_key = udp_key.encode("utf-8")
+        self.udp_sock: Optional[socket.socket] = None
+        self.udp_seq = 0
+        self.checkpoint_path = checkpoint_path
+        self.tail: Optional[dict] = None  # path, inode, offset, status of the log being tailed
+        self.file_index: dict = {}  # path -> same, for every log file scanned (current and rotated)
+        self.scan_pool: Optional[ThreadPoolExecutor] = None
+        self.transitions: list = []  # (log time, status) changes found by the latest poll
+        self.last_transition: Optional[tuple] = None
+        self.unsent: list = []  # Transitions the Pi has not seen yet (client down or Pi unreachable)
+        self.last_acked: Optional[dict] = None  # status and time of the last push the Pi acked
+        self.checkpoint_key = None
+        self.checkpoint_offset = 0
+        self.checkpoint_saved = 0.0
+        self.load_checkpoint()
 
         self.last_status: Optional[str] = None
         self.last_activity: Optional[str] = None
@@ -109,105 +287,308 @@ class TeamsPushClient:
             return {"path": TEAMS_LOG_PATH, "is_new_teams": False}
         return None
 
-    def get_teams_status(self) -> dict:
-        """Read Teams logs and extract current status."""
+    def get_log_files(self) -> list:
+        """Log files to read, newest first (New Teams rotates its logs)."""
         log_info = self.get_teams_log_path()
         if not log_info:
-            return {"availability": "Unknown", "activity": "Unknown"}
+            return []
+        if log_info["is_new_teams"]:
+            log_files = glob(os.path.join(log_info["path"], "MSTeams_*.log"))
+            log_files = [
+                f for f in log_files
+                if not any(x in f for x in ["Update", "SlimCore", "Launcher"])
+            ]
+            log_files.sort(key=os.path.getmtime, reverse=True)
+            return log_files[:MAX_LOG_FILES]
+        # Classic Teams
+        log_file = os.path.join(log_info["path"], "logs.txt")
+        return [log_file] if os.path.exists(log_file) else []
+
+    def parse_status(self, lines: list) -> Optional[str]:
+        """Most recent availability found in log lines, or None."""
+        status_lines = [line for line in lines if STATUS_LINE_PATTERN.search(line)]
+        for line in reversed(status_lines[-50:]):
+            status = status_from_line(line)
+            if status:
+                return status
+        return None
 
+    def scan_log_file(self, path: str, max_lines: Optional[int] = None) -> Optional[str]:
+        """Last status in one log file, parsing only bytes not scanned before.
+
+        self.file_index keeps inode, scanned offset and last status per file:
+        an unchanged file is answered without opening it, a grown one only
+        has its new lines parsed, and the last status found carries over
+        while no new status line appears. A new inode or a shrunken file is
+        read again (its last max_lines lines, if given).
+        """
+        entry, status = self.read_log_file(path, self.file_index.get(path), max_lines)
+        self.file_index[path] = entry
+        return status
+
+    def read_log_file(self, path: str, entry: Optional[dict], max_lines: Optional[int] = None) -> tuple:
+        """(new index entry, status) of one log file, without touching self.file_index.
+
+        Runs on the scan pool for rotated files; transitions are only
+        recorded with max_lines, i.e. for the current log on the main thread.
+        """
+        stat = os.stat(path)
+        resume = entry is not None and entry["inode"] == stat.st_ino and entry["offset"] <= stat.st_size
+        if resume and entry["offset"] == stat.st_size:
+            return entry, entry["status"]
+        with open(path, "rb") as f:
+            if resume:
+                f.seek(entry["offset"])
+            data = f.read()
+        # Only consume complete lines; a partly written one is read next poll
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].decode("utf-8", errors="ignore").splitlines()
+        if not resume and max_lines:
+            lines = lines[-max_lines:]
+
+        status = self.parse_status(lines)
+        if status is None and resume:
+            status = entry["status"]
+        if resume and max_lines:
+            # Current log: keep every change since the last poll, with its log time
+            self.transitions.extend(iter_transitions(lines, entry["status"]))
+        offset = (entry["offset"] if resume else 0) + end
+        return {"path": path, "inode": stat.st_ino, "offset": offset, "status": status}, status
+
+    def scan_older_files(self, log_files: list) -> Optional[str]:
+        """Newest status in rotated log files, walked newest first.
+
+        Files not yet in the index are read in parallel when there is a lot
+        to read; the first file (by age) with a status wins and the scans of
+        older files still queued are cancelled. Workers only return their
+        results; they are merged into the index here, on the calling thread,
+        so save_checkpoint never sees the index change under it. Scans still
+        running after a hit are dropped and redone on a later poll.
+        """
+        unscanned = sum(os.path.getsize(f) for f in log_files if f not in self.file_index)
+        if unscanned < PARALLEL_SCAN_BYTES or len(log_files) < 2:
+            for log_file in log_files:
+                status = self.scan_log_file(log_file)
+                if status:
+                    return status
+            return None
+
+        if self.scan_pool is None:
+            self.scan_pool = ThreadPoolExecutor(max_workers=SCAN_THREADS)
+        futures = [self.scan_pool.submit(self.read_log_file, f, self.file_index.get(f)) for f in log_files]
         try:
-            log_content = []
-            if log_info["is_new_teams"]:
-                # New Teams - find most recent log file
-                log_files = glob(os.path.join(log_info["path"], "MSTeams_*.log"))
-                log_files = [
-                    f for f in log_files
-                    if not any(x in f for x in ["Update", "SlimCore", "Launcher"])
-                ]
-                if log_files:
-                    log_files.sort(key=os.path.getmtime, reverse=True)
-                    with open(log_files[0], "r", errors="ignore") as f:
-                        lines = f.readlines()
-                        log_content = lines[-5000:] if len(lines) > 5000 else lines
-            else:
-                # Classic Teams
-                log_file = os.path.join(log_info["path"], "logs.txt")
-                if os.path.exists(log_file):
-                    with open(log_file, "r", errors="ignore") as f:
-                        lines = f.readlines()
-                        log_content = lines[-5000:] if len(lines) > 5000 else lines
-
-            if log_content:
-                status_pattern = re.compile(
-                    r"UserDataCrossCloudModule|UserPresenceAction|SetBadge.*status|"
-                    r"StatusIndicatorStateService|NewActivity"
-                )
-                status_lines = [line for line in log_content if status_pattern.search(line)]
-
-                if status_lines:
-                    recent_status = status_lines[-50:]
-                    for line in reversed(recent_status):
-                        # Check various status patterns
-                        match = re.search(
-                            r"availability:\s*(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,}]",
-                            line
-                        )
-                        if match:
-                            return {"availability": match.group(1), "activity": match.group(1)}
-
-                        match = re.search(
-                            r"status\s+(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,]",
-                            line
-                        )
-                        if match:
-                            return {"availability": match.group(1), "activity": match.group(1)}
-
-                        match = re.search(
-                            r"Setting the taskbar overlay icon - (Available|Away)|"
-                            r"NewActivity: (Available|Away)",
-                            line
-                        )
-                        if match:
-                            status = match.group(1) or match.group(2)
-                            return {"availability": status, "activity": status}
-
-                        match = re.search(r"NewActivity: (InAMeeting|InACall|Busy)", line)
-                        if match:
-                            return {"availability": match.group(1), "activity": match.group(1)}
-
-                        if "NewActivity: BeRightBack" in line:
-                            return {"availability": "BeRightBack", "activity": "BeRightBack"}
-
-                        match = re.search(r"NewActivity: (DoNotDisturb|Presenting)", line)
-                        if match:
-                            return {"availability": "DoNotDisturb", "activity": "DoNotDisturb"}
-
-                        if "NewActivity: Offline" in line:
-                            return {"availability": "Offline", "activity": "Offline"}
+            for log_file, future in zip(log_files, futures):
+                entry, status = future.result()
+                self.file_index[log_file] = entry
+                if status:
+                    return status
+            return None
+        finally:
+            for future in futures:
+                future.cancel()
 
-            return {"availability": "Unknown", "activity": "Unknown"}
+    def get_teams_status(self) -> dict:
+        """Read Teams logs and extract current status.
+
+        The current log is tailed: after one read of its last 5000 lines,
+        each poll only parses the bytes appended since. Right after a
+        rotation the new file has no presence lines yet, so rotated files
+        are searched newest first instead of reporting Unknown.
+        """
+        try:
+            log_files = self.get_log_files()
+            if not log_files:
+                return {"availability": "Unknown", "activity": "Unknown"}
+
+            # Forget files that were deleted or aged out of the list
+            for path in list(self.file_index):
+                if path not in log_files:
+                    del self.file_index[path]
+
+            self.transitions = []
+            status = self.scan_log_file(log_files[0], max_lines=5000)
+            self.tail = self.file_index[log_files[0]]
+            if status is None:
+                status = self.scan_older_files(log_files[1:])
+            self.save_checkpoint()
+            availability = status or "Unknown"
+            return {"availability": availability, "activity": availability}
 
         except Exception as e:
             if self.verbose:
                 print(f"Error reading logs: {e}")
             return {"availability": "Unknown", "activity": "Unknown"}
 
-    def send_status_update(self, availability: str, activity: str) -> bool:
-        """Send status update to Raspberry Pi."""
+    def load_checkpoint(self):
+        """Restore the log position and last acked push from the checkpoint file."""
+        if not self.checkpoint_path:
+            return
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                checkpoint = json.load(f)
+            self.tail = checkpoint["tail"]
+            self.last_acked = checkpoint.get("last_acked")
+            for entry in checkpoint.get("files", []) + [self.tail]:
+                self.file_index[entry["path"]] = entry
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Missing or unreadable: start cold
+
+    def save_checkpoint(self, force: bool = False):
+        """Write the checkpoint atomically if it changed.
+
+        Besides the current log it holds the index of rotated files, so they
+        are not rescanned after a restart. A new file, status or acked push
+        is written at once; a mere offset
+        advance at most every CHECKPOINT_INTERVAL seconds, since resuming a
+        little early only re-parses a few lines.
+        """
+        if not self.checkpoint_path or self.tail is None:
+            return
+        older = [entry for path, entry in self.file_index.items() if path != self.tail["path"]]
+        key = (self.tail["path"], self.tail["inode"], self.tail["status"], json.dumps(self.last_acked),
+               json.dumps(older))
+        now = time.monotonic()
+        if (not force and key == self.checkpoint_key and
+                (self.tail["offset"] == self.checkpoint_offset or now - self.checkpoint_saved < CHECKPOINT_INTERVAL)):
+            return
+        temp_path = f"{self.checkpoint_path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump({"tail": self.tail, "files": older, "last_acked": self.last_acked}, f)
+            os.replace(temp_path, self.checkpoint_path)
+        except OSError as e:
+            if self.verbose:
+                print(f"Error writing checkpoint: {e}")
+            return
+        self.checkpoint_key = key
+        self.checkpoint_offset = self.tail["offset"]
+        self.checkpoint_saved = now
+
+    def receiver_seen_seconds(self, availability: str) -> Optional[float]:
+        """Seconds since the Pi last heard this device report availability, or None.
+
+        None if the Pi shows a different status for this device, does not
+        know it, or is unreachable.
+        """
+        try:
+            response = requests.get(f"http://{self.raspberry_pi_ip}:{self.port}/users", timeout=3)
+            if response.status_code != 200:
+                return None
+            for user in response.json():
+                if self.user_id and user.get("user_id") != self.user_id:
+                    continue
+                for device in user.get("devices", []):
+                    if device.get("device_id") == self.device_id and device.get("availability") == availability:
+                        return float(device.get("seen_seconds_ago", 0))
+        except Exception:
+            pass
+        return None
+
+    def send_backfill(self) -> bool:
+        """Send transitions the Pi missed to its history in one request."""
+        transitions = [{"availability": status, "at": at} for at, status in self.unsent if at]
+        if not transitions:
+            self.unsent = []
+            return True
+        payload = {"device_id": self.device_id, "transitions": transitions[-MAX_BACKFILL:]}
+        if self.user_id:
+            payload["user_id"] = self.user_id
+        try:
+            response = requests.post(f"http://{self.raspberry_pi_ip}:{self.port}/history", json=payload, timeout=5)
+        except Exception:
+            return False
+        if response.status_code != 200:
+            return False
+        self.unsent = []
+        return True
+
+    def resume_from_checkpoint(self, status: dict) -> bool:
+        """Skip the first push after a restart if the Pi already has this status."""
+        if not self.last_acked or self.last_acked.get("status") != status["availability"]:
+            return False
+        seen = self.receiver_seen_seconds(status["availability"])
+        if seen is None:
+            return False
+        self.debouncer.stable = status["availability"]
+        self.last_status = status["availability"]
+        self.last_activity = status["activity"]
+        self.last_successful_send = datetime.now() - timedelta(seconds=seen)  # Heartbeat keeps its rhythm
+        self.is_connected = True
+        return True
+
+    def send_status_update(self, availability: str, activity: str,
+                           timings: Optional[dict] = None, changed_at: Optional[str] = None) -> bool:
+        """Send status update to Raspberry Pi.
+
+        timings carries the monotonic scan_started/detected times of the poll
+        that found this status; they go out as trace stages so the Pi can
+        report where time is spent between the log line and the LEDs.
+        """
         url = f"http://{self.raspberry_pi_ip}:{self.port}/status"
         payload = {
             "availability": availability,
             "activity": activity,
             "color": STATUS_COLORS.get(availability, "#FFFFFF"),
             "timestamp": datetime.now().isoformat(),
+            "trace": {"id": uuid.uuid4().hex[:16]},
         }
-
+        if timings:
+            payload["trace"]["scan_ms"] = round((timings["detected"] - timings["scan_started"]) * 1000, 3)
+            payload["trace"]["detect_to_push_ms"] = round((time.monotonic() - timings["detected"]) * 1000, 3)
+        payload["trace"]["pushed_at"] = time.time()
+        if self.user_id:
+            payload["user_id"] = self.user_id
+        payload["device_id"] = self.device_id
+        if changed_at:
+            payload["changed_at"] = changed_at
+
+        if self.udp_port:
+            return self.send_udp(payload)
         try:
             response = requests.post(url, json=payload, timeout=3)
             return response.status_code == 200
         except Exception:
             return False
 
+    def send_udp(self, payload: dict) -> bool:
+        """Send one status datagram and retry until the Pi acks it.
+
+        Datagram: 8-byte HMAC-SHA256 of the body, then the JSON body with a
+        client ID and a sequence number. Sequence numbers start from the
+        clock in ms so they keep increasing across client restarts.
+        """
+        if self.udp_sock is None:
+            self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_seq = max(self.udp_seq + 1, int(time.time() * 1000))
+        payload["client"] = f"{self.user_id}@{self.device_id}" if self.user_id else self.device_id
+        payload["seq"] = self.udp_seq
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        packet = hmac.new(self.udp_key, body, hashlib.sha256).digest()[:8] + body
+        expected_ack = json.dumps({"ack": self.udp_seq}, separators=(",", ":")).encode("utf-8")
+
+        timeout = 0.2
+        for _ in range(4):  # 0.2 + 0.4 + 0.8 + 1.6s, like the 3s HTTP timeout
+            try:
+                self.udp_sock.sendto(packet, (self.raspberry_pi_ip, self.udp_port))
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.udp_sock.settimeout(remaining)
+                    ack = self.udp_sock.recv(64)
+                    mac, ack_body = ack[:8], ack[8:]
+                    if ack_body == expected_ack and hmac.compare_digest(
+                            mac, hmac.new(self.udp_key, ack_body, hashlib.sha256).digest()[:8]):
+                        return True
+                    # Anything else is a late ack for an earlier push: keep waiting
+            except socket.timeout:
+                pass
+            except OSError:
+                time.sleep(timeout)
+            timeout *= 2
+        return False
+
     def test_connection(self) -> bool:
         """Test connection to Raspberry Pi."""
         try:
@@ -318,7 +699,8 @@ class TeamsPushClient:
         # Connection section
         print(self.colorize("  ----------------------------------------------------------------------", "DarkGray"))
         print(f"   {self.colorize('Connection: ', 'DarkGray')}{self.colorize(conn_text.ljust(14), conn_color)}"
-              f"{self.colorize('Updates sent: ', 'DarkGray')}{self.colorize(str(updates_sent), 'White')}")
+              f"{self.colorize('Updates sent: ', 'DarkGray')}{self.colorize(str(updates_sent).ljust(6), 'White')}"
+              f"{self.colorize('Suppressed: ', 'DarkGray')}{self.colorize(str(self.debouncer.suppressed), 'White')}")
         print(self.colorize("  ----------------------------------------------------------------------", "DarkGray"))
         print()
 
@@ -345,6 +727,7 @@ class TeamsPushClient:
 
         consecutive_errors = 0
         max_consecutive_errors = 5
+        first_poll = True
         last_check_time = datetime.now()
         # Trigger immediate first poll
         last_check_time = last_check_time.replace(
@@ -373,17 +756,40 @@ class TeamsPushClient:
                     last_check_time = now
 
                     try:
+                        scan_started = time.monotonic()
                         status = self.get_teams_status()
+                        timings = {"scan_started": scan_started, "detected": time.monotonic()}
                         update_time_str = now.strftime("%H:%M:%S")
 
-                        # Check if status changed
-                        if (status["availability"] != self.last_status or
-                                status["activity"] != self.last_activity):
-
-                            # Send update to Raspberry Pi
+                        if self.transitions:
+                            self.last_transition = self.transitions[-1]
+
+                        # First poll after a restart: nothing to push if the Pi already agrees
+                        if first_poll:
+                            first_poll = False
+                            # Changes logged while the client was not running
+                            self.unsent.extend(self.transitions)
+                            if self.resume_from_checkpoint(status):
+                                self.draw_ui(
+                                    current_status=status["availability"],
+                                    last_poll_time=poll_time_str,
+                                    countdown=countdown,
+                                    connected=self.is_connected,
+                                    updates_sent=self.update_count
+                                )
+
+                        # Push once a changed status has held for its dwell time
+                        if self.debouncer.update(status["availability"], time.monotonic()) is not None:
+
+                            # Send update to Raspberry Pi, dated by the log line that reported it
+                            changed_at = None
+                            if self.last_transition and self.last_transition[1] == status["availability"]:
+                                changed_at = self.last_transition[0]
                             sent = self.send_status_update(
                                 status["availability"],
-                                status["activity"]
+                                status["activity"],
+                                timings,
+                                changed_at
                             )
 
                             if sent:
@@ -391,9 +797,14 @@ class TeamsPushClient:
                                 self.is_connected = True
                                 self.last_successful_send = now
                                 consecutive_errors = 0
+                                self.last_acked = {"status": status["availability"], "at": now.isoformat()}
+                                self.save_checkpoint()
                             else:
                                 self.is_connected = False
                                 consecutive_errors += 1
+                                self.unsent.append((changed_at or datetime.now().astimezone().isoformat(),
+                                                    status["availability"]))
+                                del self.unsent[:-MAX_BACKFILL]
 
                             # Add to history
                             self.add_to_history(status["availability"], sent)
@@ -411,6 +822,21 @@ class TeamsPushClient:
                                 updates_sent=self.update_count
                             )
 
+                        # Re-send an unchanged status now and then so the Pi
+                        # knows this device is still around (multi-device merge)
+                        elif (self.heartbeat and self.last_successful_send and
+                                (now - self.last_successful_send).total_seconds() >= self.heartbeat):
+                            if self.send_status_update(self.last_status, self.last_activity):
+                                self.last_successful_send = now
+                                self.is_connected = True
+                                consecutive_errors = 0
+                            else:
+                                consecutive_errors += 1
+
+                        # Back in touch with the Pi: fill the gaps in its history
+                        if self.unsent and self.is_connected:
+                            self.send_backfill()
+
                         # Check for too many consecutive errors
                         if consecutive_errors >= max_consecutive_errors:
                             self.is_connected = self.test_connection()
@@ -429,6 +855,8 @@ class TeamsPushClient:
             self.show_cursor()
             print("\n")
             print(self.colorize("  Stopped.", "Yellow"))
+            print(self.colorize(f"  Status changes pushed: {self.debouncer.pushed}, "
+                                f"suppressed as flapping: {self.debouncer.suppressed}", "DarkGray"))
 
 
 def main():
@@ -457,14 +885,74 @@ def main():
         action="store_true",
         help="Enable verbose debug output"
     )
+    parser.add_argument(
+        "--user",
+        default=None,
+        help="User ID for a shared team board (default: the Pi's primary user)"
+    )
+    parser.add_argument(
+        "--device",
+        default=None,
+        help="Device ID when one user pushes from several machines (default: hostname)"
+    )
+    parser.add_argument(
+        "--heartbeat",
+        type=int,
+        default=60,
+        help="Re-send an unchanged status every N seconds, 0 to disable (default: 60)"
+    )
+    parser.add_argument(
+        "--udp-port",
+        type=int,
+        default=0,
+        help="Push over UDP to this port instead of HTTP (server.udp_port on the Pi)"
+    )
+    parser.add_argument(
+        "--udp-key",
+        default="",
+        help="Shared secret for UDP pushes (server.udp_key on the Pi)"
+    )
+    parser.add_argument(
+        "--dwell",
+        action="append",
+        default=[],
+        metavar="STATUS=SECONDS",
+        help="Seconds a status must hold before it is pushed, repeatable (e.g. --dwell Away=60)"
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=DEFAULT_CHECKPOINT,
+        help="Warm-start checkpoint file, \"\" to disable (default: ~/.teams_push_checkpoint.json)"
+    )
+    parser.add_argument(
+        "--no-debounce",
+        action="store_true",
+        help="Push every status change as soon as it is seen"
+    )
 
     args = parser.parse_args()
+    if args.udp_port and not args.udp_key:
+        parser.error("--udp-key is required with --udp-port")
+    dwell = {} if args.no_debounce else dict(DEFAULT_DWELL)
+    for item in args.dwell:
+        status, _, seconds = item.partition("=")
+        try:
+            dwell[status] = float(seconds)
+        except ValueError:
+            parser.error(f"--dwell expects STATUS=SECONDS, got {item!r}")
 
     client = TeamsPushClient(
         raspberry_pi_ip=args.ip,
         port=args.port,
         poll_interval=args.interval,
-        verbose=args.verbose
+        verbose=args.verbose,
+        user_id=args.user,
+        device_id=args.device,
+        heartbeat=args.heartbeat,
+        udp_port=args.udp_port,
+        udp_key=args.udp_key,
+        dwell=dwell,
+        checkpoint_path=args.checkpoint or None
     )
     client.run()
 
@@ -6,9 +6,22 @@ param(
     [string]$RaspberryPiIP = "192.168.50.137",  # Change to your Raspberry Pi's IP
     [int]$Port = 8080,
     [int]$PollInterval = 5,  # Seconds between status checks
+    [string]$UserId = "",  # User ID for a shared team board (empty = the Pi's primary user)
+    [string]$DeviceId = $env:COMPUTERNAME,  # Device ID when one user pushes from several machines
+    [int]$Heartbeat = 60,  # Re-send an unchanged status every N seconds (0 = off)
+    [int]$UdpPort = 0,  # Push over UDP to this port instead of HTTP (server.udp_port on the Pi)
+    [string]$UdpKey = "",  # Shared secret for UDP pushes (server.udp_key on the Pi)
+    [hashtable]$Dwell = @{},  # Seconds a status must hold before it is pushed, e.g. @{ Away = 60 }
+    [switch]$NoDebounce,  # Push every status change as soon as it is seen
+    [string]$CheckpointPath = "$env:LOCALAPPDATA\TeamsPushClient\checkpoint.json",  # Warm-start checkpoint ("" = off)
     [switch]$Verbose  # Enable verbose debug output
 )
 
+if ($UdpPort -gt 0 -and -not $UdpKey) {
+    Write-Host "-UdpKey is required with -UdpPort" -ForegroundColor Red
+    exit 1
+}
+
 # ANSI escape sequence (works in Windows Terminal, PS7+, and most modern terminals)
 $ESC = [char]27
 
@@ -45,6 +58,32 @@ $script:StatusHistory = @()
 $script:MaxHistory = 5
 $script:LastPollTime = $null
 $script:IsConnected = $false
+$script:UdpClient = $null
+$script:UdpSeq = 0
+
+# Debounce: a new status must hold for its dwell time (seconds) before it is pushed;
+# meetings, calls and DND always go out immediately
+$script:DwellSeconds = if ($NoDebounce) { @{} } else {
+    @{ "Available" = 0; "Busy" = 10; "Away" = 30; "BeRightBack" = 30; "Offline" = 60; "Unknown" = 60 }
+}
+foreach ($key in $Dwell.Keys) { $script:DwellSeconds[$key] = [double]$Dwell[$key] }
+$script:ImmediateStatuses = @("InAMeeting", "InACall", "DoNotDisturb")
+$script:StableStatus = $null
+$script:CandidateStatus = $null
+$script:CandidateWatch = [System.Diagnostics.Stopwatch]::new()
+$script:PushedCount = 0
+$script:SuppressedCount = 0
+
+# Warm-start checkpoint: log position, last status and last acked push
+$script:Tail = $null  # path, inode, offset, status of the log being tailed
+$script:FileIndex = @{}  # path -> same, for every log file scanned (current and rotated)
+$script:Transitions = @()  # @{ At; Status } changes found by the latest poll
+$script:LastTransition = $null
+$script:Unsent = @()  # Transitions the Pi has not seen yet
+$script:LastAcked = $null  # status and time of the last push the Pi acked
+$script:CheckpointKey = $null
+$script:CheckpointOffset = 0
+$script:CheckpointWatch = [System.Diagnostics.Stopwatch]::StartNew()
 
 # UI row tracking (0-based from top of drawn UI)
 $script:UIStartRow = 0
@@ -60,75 +99,275 @@ function Get-TeamsLogPath {
     return $null
 }
 
-function Get-TeamsStatus {
+function Get-LogFiles {
+    # Log files to read, newest first (New Teams rotates its logs)
     $logInfo = Get-TeamsLogPath
-    if (-not $logInfo) {
+    if (-not $logInfo) { return @() }
+    if ($logInfo.IsNewTeams) {
+        return @(Get-ChildItem -Path $logInfo.Path -Filter "MSTeams_*.log" -ErrorAction SilentlyContinue |
+                 Where-Object { $_.Name -notmatch "Update|SlimCore|Launcher" } |
+                 Sort-Object LastWriteTime -Descending | Select-Object -First 10 |
+                 ForEach-Object { $_.FullName })
+    }
+    return @($logInfo.Path)
+}
+
+$StatusLinePattern = "UserDataCrossCloudModule|UserPresenceAction|SetBadge.*status|StatusIndicatorStateService|NewActivity"
+
+function Get-StatusFromLine {
+    # Availability reported by one log line, or $null
+    param([string]$Line)
+    if ($Line -match "availability:\s*(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,}]") {
+        return $Matches[1]
+    }
+    elseif ($Line -match "status\s+(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,]") {
+        return $Matches[1]
+    }
+    elseif ($Line -match "Setting the taskbar overlay icon - (Available|Away)|NewActivity: (Available|Away)") {
+        $status = if ($Matches[1]) { $Matches[1] } else { $Matches[2] }
+        return $status
+    }
+    elseif ($Line -match "NewActivity: (InAMeeting|InACall|Busy)") {
+        return $Matches[1]
+    }
+    elseif ($Line -match "NewActivity: BeRightBack") {
+        return "BeRightBack"
+    }
+    elseif ($Line -match "NewActivity: (DoNotDisturb|Presenting)") {
+        return "DoNotDisturb"
+    }
+    elseif ($Line -match "NewActivity: Offline") {
+        return "Offline"
+    }
+    return $null
+}
+
+function Get-StatusFromLines {
+    # Most recent availability found in log lines, or $null
+    param([string[]]$Lines)
+    $recentStatus = @($Lines | Where-Object { $_ -match $StatusLinePattern } | Select-Object -Last 50)
+    for ($i = $recentStatus.Count - 1; $i -ge 0; $i--) {
+        $status = Get-StatusFromLine -Line $recentStatus[$i]
+        if ($status) { return $status }
+    }
+    return $null
+}
+
+function Get-LogTimestamp {
+    # ISO time (with UTC offset) a log line was written, or $null. New Teams lines start with
+    # "2024-01-15T10:30:00.123+01:00", classic ones with "Mon Jan 15 2024 10:30:00 GMT+0100"
+    param([string]$Line)
+    try {
+        if ($Line -match "^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:[.,]\d+)?(Z|[+-]\d{2}:?\d{2})?") {
+            if (-not $Matches[3]) { return "$($Matches[1])T$($Matches[2])" }
+            $moment = [DateTimeOffset]::Parse("$($Matches[1])T$($Matches[2])$($Matches[3])", [Globalization.CultureInfo]::InvariantCulture)
+            return $moment.ToString("yyyy-MM-ddTHH:mm:sszzz")
+        }
+        if ($Line -match "^\w{3} (\w{3} \d{1,2} \d{4} \d{2}:\d{2}:\d{2}) GMT([+-]\d{2})(\d{2})") {
+            $moment = [DateTimeOffset]::ParseExact("$($Matches[1]) $($Matches[2]):$($Matches[3])", "MMM d yyyy HH:mm:ss zzz",
+                                                   [Globalization.CultureInfo]::InvariantCulture)
+            return $moment.ToString("yyyy-MM-ddTHH:mm:sszzz")
+        }
+    }
+    catch { }
+    return $null
+}
+
+function Get-Transitions {
+    # Streams log lines from the pipeline and emits @{ At; Status } for every status change;
+    # $Previous is the status before the first line
+    param([Parameter(ValueFromPipeline = $true)][string]$Line, [string]$Previous)
+    begin { $current = $Previous }
+    process {
+        if ($Line -notmatch $StatusLinePattern) { return }
+        $status = Get-StatusFromLine -Line $Line
+        if ($status -and $status -ne $current) {
+            $current = $status
+            @{ At = Get-LogTimestamp -Line $Line; Status = $status }
+        }
+    }
+}
+
+function Read-LogFile {
+    # Last status in one log file, parsing only bytes not scanned before. $script:FileIndex
+    # keeps file identity, scanned offset and last status per file: an unchanged file is
+    # answered without opening it, a grown one only has its new lines parsed, and the last
+    # status found carries over. A new or shrunken file is read again (last $MaxLines lines).
+    param([string]$Path, [int]$MaxLines = 0)
+    $item = Get-Item -LiteralPath $Path -ErrorAction Stop
+    $fileId = $item.CreationTimeUtc.Ticks  # No inodes on Windows; a rotated log is a new file
+    $entry = $script:FileIndex[$Path]
+    $resume = $entry -and $entry.inode -eq $fileId -and $entry.offset -le $item.Length
+    if ($resume -and $entry.offset -eq $item.Length) { return $entry.status }
+    $start = if ($resume) { [long]$entry.offset } else { 0 }
+
+    # Teams keeps its log open for writing
+    $stream = [System.IO.File]::Open($Path, "Open", "Read", "ReadWrite")
+    try {
+        $null = $stream.Seek($start, "Begin")
+        $buffer = New-Object byte[] ([Math]::Max(0, $stream.Length - $start))
+        $read = 0
+        while ($read -lt $buffer.Length) {
+            $n = $stream.Read($buffer, $read, $buffer.Length - $read)
+            if ($n -le 0) { break }
+            $read += $n
+        }
+    }
+    finally { $stream.Dispose() }
+
+    # Only consume complete lines; a partly written one is read next poll
+    $end = if ($read -gt 0) { [Array]::LastIndexOf($buffer, [byte]10, $read - 1) + 1 } else { 0 }
+    $lines = [Text.Encoding]::UTF8.GetString($buffer, 0, $end) -split "`r?`n"
+    if (-not $resume -and $MaxLines -gt 0) { $lines = @($lines | Select-Object -Last $MaxLines) }
+
+    $status = Get-StatusFromLines -Lines $lines
+    if (-not $status -and $resume) { $status = $entry.status }
+    if ($resume -and $MaxLines -gt 0) {
+        # Current log: keep every change since the last poll, with its log time
+        $script:Transitions += @($lines | Get-Transitions -Previous $entry.status)
+    }
+    $script:FileIndex[$Path] = @{ path = $Path; inode = $fileId; offset = $start + $end; status = $status }
+    return $status
+}
+
+function Get-TeamsStatus {
+    # The current log is tailed: after one read of its last 5000 lines, each poll only
+    # parses the bytes appended since. Right after a rotation the new file has no presence
+    # lines yet, so rotated files are searched newest first instead of reporting Unknown.
+    try {
+        $logFiles = Get-LogFiles
+        if ($logFiles.Count -eq 0) {
+            return @{ Availability = "Unknown"; Activity = "Unknown" }
+        }
+
+        # Forget files that were deleted or aged out of the list
+        foreach ($path in @($script:FileIndex.Keys)) {
+            if ($logFiles -notcontains $path) { $script:FileIndex.Remove($path) }
+        }
+
+        $script:Transitions = @()
+        $status = Read-LogFile -Path $logFiles[0] -MaxLines 5000
+        $script:Tail = $script:FileIndex[$logFiles[0]]
+        for ($i = 1; -not $status -and $i -lt $logFiles.Count; $i++) {
+            $status = Read-LogFile -Path $logFiles[$i]
+        }
+        Save-Checkpoint
+
+        if (-not $status) { $status = "Unknown" }
+        return @{ Availability = $status; Activity = $status }
+    }
+    catch {
         return @{ Availability = "Unknown"; Activity = "Unknown" }
     }
+}
 
+function Import-Checkpoint {
+    # Restore the log position and last acked push; a missing or unreadable file starts cold
+    if (-not $CheckpointPath -or -not (Test-Path -LiteralPath $CheckpointPath)) { return }
     try {
-        $logContent = @()
-        if ($logInfo.IsNewTeams) {
-            $logFiles = Get-ChildItem -Path $logInfo.Path -Filter "MSTeams_*.log" -ErrorAction SilentlyContinue |
-                        Where-Object { $_.Name -notmatch "Update|SlimCore|Launcher" } |
-                        Sort-Object LastWriteTime -Descending | Select-Object -First 1
-            if ($logFiles) {
-                $logContent = Get-Content $logFiles[0].FullName -Tail 5000 -ErrorAction SilentlyContinue
+        $checkpoint = Get-Content -LiteralPath $CheckpointPath -Raw | ConvertFrom-Json
+        foreach ($entry in @($checkpoint.files) + @($checkpoint.tail)) {
+            if (-not $entry) { continue }
+            $script:FileIndex[$entry.path] = @{
+                path = $entry.path; inode = [long]$entry.inode; offset = [long]$entry.offset; status = $entry.status
             }
         }
-        else {
-            $logContent = Get-Content $logInfo.Path -Tail 5000 -ErrorAction Stop
+        if ($checkpoint.tail) { $script:Tail = $script:FileIndex[$checkpoint.tail.path] }
+        if ($checkpoint.last_acked) {
+            $script:LastAcked = @{ status = $checkpoint.last_acked.status; at = $checkpoint.last_acked.at }
         }
+    }
+    catch { }
+}
 
-        if ($logContent.Count -gt 0) {
-            $statusLines = $logContent | Where-Object {
-                $_ -match "UserDataCrossCloudModule|UserPresenceAction|SetBadge.*status|StatusIndicatorStateService|NewActivity"
-            }
-            if ($statusLines) {
-                $recentStatus = @($statusLines | Select-Object -Last 50)
-                for ($i = $recentStatus.Count - 1; $i -ge 0; $i--) {
-                    $line = $recentStatus[$i]
-                    if ($line -match "availability:\s*(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,}]") {
-                        return @{ Availability = $Matches[1]; Activity = $Matches[1] }
-                    }
-                    elseif ($line -match "status\s+(Available|Busy|Away|BeRightBack|DoNotDisturb|Offline)[\s,]") {
-                        return @{ Availability = $Matches[1]; Activity = $Matches[1] }
-                    }
-                    elseif ($line -match "Setting the taskbar overlay icon - (Available|Away)|NewActivity: (Available|Away)") {
-                        $status = if ($Matches[1]) { $Matches[1] } else { $Matches[2] }
-                        return @{ Availability = $status; Activity = $status }
-                    }
-                    elseif ($line -match "NewActivity: (InAMeeting|InACall|Busy)") {
-                        return @{ Availability = $Matches[1]; Activity = $Matches[1] }
-                    }
-                    elseif ($line -match "NewActivity: BeRightBack") {
-                        return @{ Availability = "BeRightBack"; Activity = "BeRightBack" }
-                    }
-                    elseif ($line -match "NewActivity: (DoNotDisturb|Presenting)") {
-                        return @{ Availability = "DoNotDisturb"; Activity = "DoNotDisturb" }
-                    }
-                    elseif ($line -match "NewActivity: Offline") {
-                        return @{ Availability = "Offline"; Activity = "Offline" }
-                    }
+function Save-Checkpoint {
+    # Written atomically (temp file + rename). Holds the rotated-file index too, so those are
+    # not rescanned after a restart. A new file, status or acked push is written at once;
+    # a mere offset advance at most every 60 seconds.
+    param([switch]$Force)
+    if (-not $CheckpointPath -or -not $script:Tail) { return }
+    $ackedStatus = if ($script:LastAcked) { $script:LastAcked.status } else { "" }
+    $older = @($script:FileIndex.Values | Where-Object { $_.path -ne $script:Tail.path })
+    $olderKey = ($older | ForEach-Object { "$($_.path):$($_.offset):$($_.status)" }) -join ","
+    $key = "$($script:Tail.path)|$($script:Tail.inode)|$($script:Tail.status)|$ackedStatus|$($script:LastAcked.at)|$olderKey"
+    if (-not $Force -and $key -eq $script:CheckpointKey -and
+        ($script:Tail.offset -eq $script:CheckpointOffset -or $script:CheckpointWatch.Elapsed.TotalSeconds -lt 60)) {
+        return
+    }
+    try {
+        $directory = Split-Path -Parent $CheckpointPath
+        if ($directory -and -not (Test-Path -LiteralPath $directory)) {
+            $null = New-Item -ItemType Directory -Path $directory -Force
+        }
+        $tempPath = "$CheckpointPath.tmp"
+        @{ tail = $script:Tail; files = $older; last_acked = $script:LastAcked } | ConvertTo-Json -Compress -Depth 3 |
+            Set-Content -LiteralPath $tempPath -Encoding UTF8
+        Move-Item -LiteralPath $tempPath -Destination $CheckpointPath -Force
+    }
+    catch { return }
+    $script:CheckpointKey = $key
+    $script:CheckpointOffset = $script:Tail.offset
+    $script:CheckpointWatch.Restart()
+}
+
+function Send-Backfill {
+    # Send transitions the Pi missed (client down or Pi unreachable) to its history in one request
+    $transitions = @($script:Unsent | Where-Object { $_.At } | Select-Object -Last 500 |
+                     ForEach-Object { @{ availability = $_.Status; at = $_.At } })
+    if ($transitions.Count -eq 0) {
+        $script:Unsent = @()
+        return
+    }
+    $payload = @{ device_id = $DeviceId; transitions = $transitions }
+    if ($UserId) { $payload.user_id = $UserId }
+    try {
+        $null = Invoke-RestMethod -Uri "http://${RaspberryPiIP}:${Port}/history" -Method POST `
+                    -Body ($payload | ConvertTo-Json -Depth 3) -ContentType "application/json" -TimeoutSec 5
+        $script:Unsent = @()
+    }
+    catch { }
+}
+
+function Test-ReceiverAgrees {
+    # Seconds since the Pi last heard this device report $Availability, or $null if it shows
+    # something else for this device, does not know it, or is unreachable
+    param([string]$Availability)
+    try {
+        $users = Invoke-RestMethod -Uri "http://${RaspberryPiIP}:${Port}/users" -Method GET -TimeoutSec 3
+        foreach ($user in @($users)) {
+            if ($UserId -and $user.user_id -ne $UserId) { continue }
+            foreach ($device in @($user.devices)) {
+                if ($device.device_id -eq $DeviceId -and $device.availability -eq $Availability) {
+                    return [double]$device.seen_seconds_ago
                 }
             }
         }
-        return @{ Availability = "Unknown"; Activity = "Unknown" }
-    }
-    catch {
-        return @{ Availability = "Unknown"; Activity = "Unknown" }
     }
+    catch { }
+    return $null
 }
 
 function Send-StatusUpdate {
-    param([string]$Availability, [string]$Activity)
+    # ScanMs/DetectedWatch time the poll that found this status; they are sent as
+    # trace stages so the Pi can report where time goes between log line and LEDs
+    param([string]$Availability, [string]$Activity, [double]$ScanMs = -1, $DetectedWatch = $null, [string]$ChangedAt = "")
     $url = "http://${RaspberryPiIP}:${Port}/status"
+    $trace = @{ id = [guid]::NewGuid().ToString("N").Substring(0, 16) }
+    if ($ScanMs -ge 0) { $trace.scan_ms = [Math]::Round($ScanMs, 3) }
+    if ($DetectedWatch) { $trace.detect_to_push_ms = [Math]::Round($DetectedWatch.Elapsed.TotalMilliseconds, 3) }
+    $trace.pushed_at = [DateTimeOffset]::UtcNow.ToUnixTimeMilliseconds() / 1000.0
     $payload = @{
         availability = $Availability
         activity = $Activity
         color = $StatusColors[$Availability]
         timestamp = (Get-Date).ToString("o")
-    } | ConvertTo-Json
+        trace = $trace
+    }
+    if ($UserId) { $payload.user_id = $UserId }
+    $payload.device_id = $DeviceId
+    if ($ChangedAt) { $payload.changed_at = $ChangedAt }
+    if ($UdpPort -gt 0) { return Send-UdpStatus -Payload $payload }
+    $payload = $payload | ConvertTo-Json
 
     try {
         $null = Invoke-RestMethod -Uri $url -Method POST -Body $payload -ContentType "application/json" -TimeoutSec 3
@@ -137,6 +376,68 @@ function Send-StatusUpdate {
     catch { return $false }
 }
 
+function Send-UdpStatus {
+    # One datagram: 8-byte HMAC-SHA256 of the body, then the JSON body with a client ID
+    # and a sequence number (clock ms, so it keeps increasing across restarts).
+    # Retries until the Pi acks with the same framing around {"ack":seq}.
+    param([hashtable]$Payload)
+    if (-not $script:UdpClient) { $script:UdpClient = New-Object System.Net.Sockets.UdpClient }
+    $script:UdpSeq = [Math]::Max($script:UdpSeq + 1, [DateTimeOffset]::UtcNow.ToUnixTimeMilliseconds())
+    $Payload.client = if ($UserId) { "$UserId@$DeviceId" } else { $DeviceId }
+    $Payload.seq = $script:UdpSeq
+    $hmac = New-Object System.Security.Cryptography.HMACSHA256 (, [Text.Encoding]::UTF8.GetBytes($UdpKey))
+    $body = [Text.Encoding]::UTF8.GetBytes(($Payload | ConvertTo-Json -Compress))
+    [byte[]]$packet = $hmac.ComputeHash($body)[0..7] + $body
+    $expectedAck = "{""ack"":$($script:UdpSeq)}"
+
+    $timeout = 200  # 0.2 + 0.4 + 0.8 + 1.6s, like the 3s HTTP timeout
+    for ($i = 0; $i -lt 4; $i++) {
+        try { $null = $script:UdpClient.Send($packet, $packet.Length, $RaspberryPiIP, $UdpPort) } catch { }
+        $deadline = [DateTime]::UtcNow.AddMilliseconds($timeout)
+        while (($remaining = ($deadline - [DateTime]::UtcNow).TotalMilliseconds) -gt 0) {
+            $script:UdpClient.Client.ReceiveTimeout = [Math]::Max(1, [int]$remaining)
+            $remote = New-Object System.Net.IPEndPoint ([System.Net.IPAddress]::Any, 0)
+            try { $ack = $script:UdpClient.Receive([ref]$remote) } catch { break }
+            if ($ack.Length -le 8) { continue }
+            [byte[]]$ackBody = $ack[8..($ack.Length - 1)]
+            # Anything else is a late ack for an earlier push: keep waiting
+            if ([Text.Encoding]::UTF8.GetString($ackBody) -eq $expectedAck -and
+                [Convert]::ToBase64String($hmac.ComputeHash($ackBody)[0..7]) -eq [Convert]::ToBase64String($ack[0..7])) {
+                return $true
+            }
+        }
+        $timeout *= 2
+    }
+    return $false
+}
+
+function Update-Debouncer {
+    # Feed one polled status; returns $true once it should be pushed. Flips that
+    # revert or are replaced before their dwell time are counted as suppressed.
+    param([string]$Status)
+    if ($Status -eq $script:StableStatus) {
+        if ($script:CandidateStatus) {
+            $script:SuppressedCount++
+            $script:CandidateStatus = $null
+        }
+        return $false
+    }
+    if ($Status -ne $script:CandidateStatus) {
+        if ($script:CandidateStatus) { $script:SuppressedCount++ }
+        $script:CandidateStatus = $Status
+        $script:CandidateWatch.Restart()
+    }
+    $dwellSeconds = if ($script:DwellSeconds.ContainsKey($Status)) { $script:DwellSeconds[$Status] } else { 0 }
+    if ($null -eq $script:StableStatus -or $script:ImmediateStatuses -contains $Status -or
+        $script:CandidateWatch.Elapsed.TotalSeconds -ge $dwellSeconds) {
+        $script:StableStatus = $Status
+        $script:CandidateStatus = $null
+        $script:PushedCount++
+        return $true
+    }
+    return $false
+}
+
 function Test-RaspberryPiConnection {
     try {
         $null = Invoke-RestMethod -Uri "http://${RaspberryPiIP}:${Port}/" -Method GET -TimeoutSec 3
@@ -273,7 +574,9 @@ function Draw-UI {
     Write-Host "   Connection: " -NoNewline -ForegroundColor DarkGray
     Write-Host $connText.PadRight(14) -NoNewline -ForegroundColor $connColor
     Write-Host "Updates sent: " -NoNewline -ForegroundColor DarkGray
-    Write-Host $UpdatesSent -ForegroundColor White
+    Write-Host "$UpdatesSent".PadRight(6) -NoNewline -ForegroundColor White
+    Write-Host "Suppressed: " -NoNewline -ForegroundColor DarkGray
+    Write-Host $script:SuppressedCount -ForegroundColor White
     Write-Host "  ----------------------------------------------------------------------" -ForegroundColor DarkGray
     Write-Host ""
 
@@ -310,7 +613,9 @@ function Update-ConnectionLine {
         Write-Host "   Connection: " -NoNewline -ForegroundColor DarkGray
         Write-Host $connText.PadRight(14) -NoNewline -ForegroundColor $connColor
         Write-Host "Updates sent: " -NoNewline -ForegroundColor DarkGray
-        Write-Host "$UpdatesSent".PadRight(20) -ForegroundColor White
+        Write-Host "$UpdatesSent".PadRight(6) -NoNewline -ForegroundColor White
+        Write-Host "Suppressed: " -NoNewline -ForegroundColor DarkGray
+        Write-Host "$($script:SuppressedCount)".PadRight(8) -ForegroundColor White
     } catch { }
 }
 
@@ -374,7 +679,10 @@ Draw-UI -CurrentStatus "Unknown" -Connected $false -UpdatesSent 0
 $script:IsConnected = Test-RaspberryPiConnection
 Update-ConnectionLine -Connected $script:IsConnected -UpdatesSent $script:UpdateCount
 
+Import-Checkpoint
+
 # Main monitoring loop with countdown
+$firstPoll = $true
 $consecutiveErrors = 0
 $maxConsecutiveErrors = 5
 # Initialize to trigger immediate first poll
@@ -399,27 +707,54 @@ try {
             $lastCheckTime = $now
 
             try {
+                $scanWatch = [Diagnostics.Stopwatch]::StartNew()
                 $status = Get-TeamsStatus
+                $scanMs = $scanWatch.Elapsed.TotalMilliseconds
+                $detectedWatch = [Diagnostics.Stopwatch]::StartNew()
 
                 # Always update current status display
                 $updateTimeStr = $now.ToString("HH:mm:ss")
                 Update-StatusLine -Status $status.Availability -UpdateTime $updateTimeStr
 
-                # Check if status changed
-                if ($status.Availability -ne $script:LastStatus -or $status.Activity -ne $script:LastActivity) {
+                if ($script:Transitions.Count -gt 0) { $script:LastTransition = $script:Transitions[-1] }
+
+                # First poll after a restart: nothing to push if the Pi already agrees
+                if ($firstPoll) {
+                    $firstPoll = $false
+                    $script:Unsent += $script:Transitions  # Changes logged while the client was not running
+                    if ($script:LastAcked -and $script:LastAcked.status -eq $status.Availability) {
+                        $seen = Test-ReceiverAgrees -Availability $status.Availability
+                        if ($null -ne $seen) {
+                            $script:StableStatus = $status.Availability
+                            $script:LastStatus = $status.Availability
+                            $script:LastActivity = $status.Activity
+                            $script:LastSuccessfulSend = $now.AddSeconds(-$seen)  # Heartbeat keeps its rhythm
+                        }
+                    }
+                }
+
+                # Push once a changed status has held for its dwell time
+                $suppressedBefore = $script:SuppressedCount
+                if (Update-Debouncer -Status $status.Availability) {
 
                     # Send update to Raspberry Pi
-                    $sent = Send-StatusUpdate -Availability $status.Availability -Activity $status.Activity
+                    # Dated by the log line that reported it
+                    $changedAt = if ($script:LastTransition -and $script:LastTransition.Status -eq $status.Availability) { $script:LastTransition.At } else { "" }
+                    $sent = Send-StatusUpdate -Availability $status.Availability -Activity $status.Activity -ScanMs $scanMs -DetectedWatch $detectedWatch -ChangedAt $changedAt
 
                     if ($sent) {
                         $script:UpdateCount++
                         $script:IsConnected = $true
                         $script:LastSuccessfulSend = $now
                         $consecutiveErrors = 0
+                        $script:LastAcked = @{ status = $status.Availability; at = $now.ToString("o") }
+                        Save-Checkpoint
                     }
                     else {
                         $script:IsConnected = $false
                         $consecutiveErrors++
+                        $at = if ($changedAt) { $changedAt } else { (Get-Date).ToString("yyyy-MM-ddTHH:mm:sszzz") }
+                        $script:Unsent = @($script:Unsent + @{ At = $at; Status = $status.Availability } | Select-Object -Last 500)
                     }
 
                     # Add to history and update display
@@ -430,6 +765,21 @@ try {
                     $script:LastStatus = $status.Availability
                     $script:LastActivity = $status.Activity
                 }
+                # Re-send an unchanged status now and then so the Pi knows this device is still around
+                elseif ($Heartbeat -gt 0 -and $script:LastSuccessfulSend -and ($now - $script:LastSuccessfulSend).TotalSeconds -ge $Heartbeat) {
+                    if (Send-StatusUpdate -Availability $script:LastStatus -Activity $script:LastActivity) {
+                        $script:LastSuccessfulSend = $now
+                        $script:IsConnected = $true
+                        $consecutiveErrors = 0
+                    }
+                    else { $consecutiveErrors++ }
+                }
+
+                # Back in touch with the Pi: fill the gaps in its history
+                if ($script:Unsent.Count -gt 0 -and $script:IsConnected) { Send-Backfill }
+                if ($script:SuppressedCount -ne $suppressedBefore) {
+                    Update-ConnectionLine -Connected $script:IsConnected -UpdatesSent $script:UpdateCount
+                }
 
                 # Check for too many consecutive errors
                 if ($consecutiveErrors -ge $maxConsecutiveErrors) {
@@ -453,4 +803,5 @@ finally {
     [Console]::SetCursorPosition(0, $script:FooterRow + 2)
     Write-Host ""
     Write-Host "  Stopped." -ForegroundColor Yellow
+    Write-Host "  Status changes pushed: $($script:PushedCount), suppressed as flapping: $($script:SuppressedCount)" -ForegroundColor DarkGray
 }
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+MS Teams Presence - Startup benchmark
+Measures how long after launch the Pi server accepts POST /status, and how
+long it takes to exit after SIGTERM
+
+Runs the server on the virtual display with a throwaway config, so it works on
+any machine (no Unicorn HAT needed). Each run spawns a fresh process, polls
+POST /status until it answers 200, then sends SIGTERM and waits for the exit.
+With --max-stop-ms the script fails if any shutdown took longer.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "teams_status_integrated_push.py")
+
+
+def free_port() -> int:
+    """Ask the OS for an unused TCP port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_config(port: int, web: bool) -> str:
+    """Write a benchmark config (JSON is valid YAML) and return its path."""
+    config = {
+        "server": {"port": port, "history_file": ""},  # Every run starts from an empty history
+        "unicorn": {"brightness": 0.5, "animation_mode": "pulse", "backend": "virtual"},
+        "web": {"enabled": web, "host": "127.0.0.1", "port": free_port()},
+        "notifications": {"enabled": False, "ntfy_topic": "", "ntfy_server": "", "only_on_change": True},
+        "homeassistant": {"enabled": False},
+    }
+    fd, path = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(fd, "w") as f:
+        json.dump(config, f)
+    return path
+
+
+def post_status(port: int) -> bool:
+    """Try one POST /status; True if the server answered 200."""
+    body = json.dumps({"availability": "Available", "activity": "Available"}).encode("utf-8")
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/status", data=body,
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def measure_once(web: bool, timeout: float) -> tuple:
+    """Launch the server; return (seconds until POST /status succeeds, seconds from SIGTERM to exit)."""
+    port = free_port()
+    config_path = write_config(port, web)
+    env = dict(os.environ, TEAMS_PRESENCE_CONFIG=config_path)
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.monotonic() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            if post_status(port):
+                ready = time.monotonic() - started
+                break
+            time.sleep(0.005)
+        else:
+            raise RuntimeError(f"server not ready after {timeout}s")
+        stopping = time.monotonic()
+        proc.terminate()
+        if proc.wait(timeout=timeout) != 0:
+            raise RuntimeError(f"server exited with code {proc.returncode} on SIGTERM")
+        return ready, time.monotonic() - stopping
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        os.unlink(config_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Pi server time-to-POST-ready")
+    parser.add_argument("--runs", type=int, default=5, help="Number of launches (default: 5)")
+    parser.add_argument("--web", action="store_true", help="Also start the web dashboard")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-run timeout in seconds (default: 30)")
+    parser.add_argument("--max-stop-ms", type=float, help="Fail if a SIGTERM-to-exit time exceeds this")
+    args = parser.parse_args()
+
+    samples, stops = [], []
+    for i in range(args.runs):
+        elapsed, stopped = measure_once(args.web, args.timeout)
+        samples.append(elapsed)
+        stops.append(stopped)
+        print(f"  run {i + 1}: POST-ready in {elapsed * 1000:.0f}ms, stopped in {stopped * 1000:.0f}ms")
+
+    print()
+    for name, values in (("ready", samples), ("stop", stops)):
+        print(f"  {name.ljust(6)}min {min(values) * 1000:.0f}ms  "
+              f"median {statistics.median(values) * 1000:.0f}ms  "
+              f"max {max(values) * 1000:.0f}ms")
+    if args.max_stop_ms is not None and max(stops) * 1000 > args.max_stop_ms:
+        print(f"  [!!] Shutdown took longer than {args.max_stop_ms:.0f}ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+MS Teams Presence - Receiver load test and traffic replay
+Drives POST /status with simulated clients or recorded traffic and reports
+throughput, latency percentiles and error rates
+
+By default a local server is launched on the virtual display with a throwaway
+config, pointed at an in-process ntfy stand-in (--ntfy) and a minimal MQTT
+broker (--mqtt), so runs are repeatable on any machine. Use --target to hit a
+server that is already running instead.
+
+Examples:
+  python3 load_test.py load --clients 20 --users 2 --rate 5 --duration 10 --pattern flip
+  python3 load_test.py replay traffic.jsonl --speed 20
+
+Record real traffic on the Pi by setting server.record_file in config_push.yaml.
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark_startup import SERVER_SCRIPT, free_port, post_status
+
+STATUSES = ["Available", "Busy", "Away", "BeRightBack", "DoNotDisturb", "InAMeeting", "InACall", "Offline"]
+MAX_DEVICES = 16  # Devices the server tracks per user (MAX_DEVICES in teams_status_integrated_push.py)
+
+
+# ============================================================================
+# STAND-IN SERVICES
+# ============================================================================
+
+class NtfyStandIn:
+    """Local HTTP server that accepts ntfy publishes and counts them."""
+
+    def __init__(self):
+        stand_in = self
+        self.received = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stand_in.received += 1
+                self.send_response(200)
+                self.end_headers()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class MockMqttBroker:
+    """Just enough MQTT 3.1.1 to accept a client and count its publishes."""
+
+    def __init__(self):
+        broker = self
+        self.published = 0
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                sock = self.request
+                while True:
+                    header = sock.recv(1)
+                    if not header:
+                        return
+                    packet_type = header[0] >> 4
+                    length, multiplier = 0, 1
+                    while True:
+                        byte = sock.recv(1)
+                        if not byte:
+                            return
+                        length += (byte[0] & 0x7F) * multiplier
+                        multiplier *= 128
+                        if not byte[0] & 0x80:
+                            break
+                    body = b""
+                    while len(body) < length:
+                        chunk = sock.recv(length - len(body))
+                        if not chunk:
+                            return
+                        body += chunk
+                    if packet_type == 1:  # CONNECT -> CONNACK accepted
+                        sock.sendall(b"\x20\x02\x00\x00")
+                    elif packet_type == 3:  # PUBLISH
+                        broker.published += 1
+                        qos = (header[0] >> 1) & 0x03
+                        if qos:
+                            topic_length = int.from_bytes(body[:2], "big")
+                            packet_id = body[2 + topic_length:4 + topic_length]
+                            sock.sendall((b"\x40\x02" if qos == 1 else b"\x50\x02") + packet_id)
+                    elif packet_type == 12:  # PINGREQ -> PINGRESP
+                        sock.sendall(b"\xd0\x00")
+                    elif packet_type == 14:  # DISCONNECT
+                        return
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+
+
+class LocalServer:
+    """Pi server in a subprocess on the virtual display."""
+
+    def __init__(self, animation_mode: str, ntfy: NtfyStandIn = None, broker: MockMqttBroker = None):
+        self.port = free_port()
+        config = {
+            # Every simulated client shares 127.0.0.1, so lift the per-address rate limit;
+            # no history file, so runs neither touch the source tree nor inherit each other's history
+            "server": {"port": self.port, "rate_limit": 1000000, "rate_burst": 1000000, "history_file": ""},
+            "unicorn": {"animation_mode": animation_mode, "backend": "virtual"},
+            "web": {"enabled": False, "port": free_port()},
+            "notifications": {"enabled": ntfy is not None, "ntfy_server": ntfy.url if ntfy else "",
+                              "ntfy_topic": "loadtest"},
+            "homeassistant": {"enabled": broker is not None, "mqtt_broker": "127.0.0.1",
+                              "mqtt_port": broker.port if broker else 1883},
+        }
+        fd, self.config_path = tempfile.mkstemp(suffix=".yaml")
+        with os.fdopen(fd, "w") as f:
+            json.dump(config, f)  # JSON is valid YAML
+        env = dict(os.environ, TEAMS_PRESENCE_CONFIG=self.config_path)
+        self.proc = subprocess.Popen([sys.executable, SERVER_SCRIPT], env=env,
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while not post_status(self.port):
+            if self.proc.poll() is not None or time.monotonic() > deadline:
+                self.close()
+                raise RuntimeError("local server failed to start")
+            time.sleep(0.01)
+
+    def close(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        os.unlink(self.config_path)
+
+
+# ============================================================================
+# LOAD GENERATION
+# ============================================================================
+
+class Results:
+    """Latency samples and error counts shared by all client threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.errors = {}
+
+    def add(self, latency: float, error: str = None):
+        with self.lock:
+            if error:
+                self.errors[error] = self.errors.get(error, 0) + 1
+            else:
+                self.latencies.append(latency)
+
+
+def post(url: str, payload: dict, results: Results):
+    """Send one POST /status and record its latency or error."""
+    body = json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            response.read()
+        results.add(time.perf_counter() - started)
+    except urllib.error.HTTPError as e:
+        results.add(0.0, f"HTTP {e.code}")
+    except (OSError, socket.timeout) as e:
+        results.add(0.0, type(e).__name__)
+
+
+def next_status(pattern: str, previous: str, rng: random.Random) -> str:
+    if pattern == "steady":
+        return "Available"
+    if pattern == "flip":
+        return "Busy" if previous == "Available" else "Available"
+    return rng.choice(STATUSES)
+
+
+def client_user(index: int, users: int):
+    """User ID of simulated client index; with one user, the server's primary user."""
+    return f"loadtest-user-{index % users}" if users > 1 else None
+
+
+def expected_devices(clients: int, users: int) -> int:
+    """Devices the presence table should hold after a load run."""
+    per_user = [len(range(u, clients, users)) for u in range(users)]
+    return sum(min(count, MAX_DEVICES) for count in per_user)
+
+
+def run_clients(url: str, clients: int, rate: float, duration: float, pattern: str, users: int,
+                results: Results):
+    """N clients, each a device of its own POSTing rate times per second on its own schedule.
+
+    Clients are spread round-robin over users; every client sends its own
+    device_id, since the server otherwise files all of them under the one
+    source address they share.
+    """
+    def client(index: int):
+        rng = random.Random(index)
+        payload = {"device_id": f"loadtest-{index}"}
+        user_id = client_user(index, users)
+        if user_id:
+            payload["user_id"] = user_id
+        status = "Available"
+        interval = 1.0 / rate
+        start = time.monotonic() + rng.random() * interval  # Spread clients over the first interval
+        sent = 0
+        while True:
+            due = start + sent * interval
+            if due - start >= duration:
+                return
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            status = next_status(pattern, status, rng)
+            post(url, dict(payload, availability=status, activity=status), results)
+            sent += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def replay(url: str, path: str, speed: float, results: Results):
+    """Re-send recorded POST bodies, keeping their spacing divided by speed."""
+    with open(path, "r") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        return
+    first = records[0]["t"]
+    start = time.monotonic()
+    for record in records:
+        delay = start + (record["t"] - first) / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        post(url, record["body"], results)
+
+
+def loadtest_devices(base_url: str) -> int:
+    """Simulated client devices in the server's presence table (GET /users), or -1 if unreadable."""
+    try:
+        with urllib.request.urlopen(f"{base_url}/users", timeout=10) as response:
+            users = json.loads(response.read())
+    except (OSError, ValueError):
+        return -1
+    return sum(1 for user in users for device in user["devices"] if device["device_id"].startswith("loadtest-"))
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def report(results: Results, elapsed: float, ntfy: NtfyStandIn = None, broker: MockMqttBroker = None,
+           devices: tuple = None):
+    latencies = sorted(results.latencies)
+    errors = sum(results.errors.values())
+    total = len(latencies) + errors
+    print()
+    print(f"  Requests:    {total} in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    print(f"  Errors:      {errors} ({errors / total * 100 if total else 0:.2f}%)"
+          + (f"  {results.errors}" if results.errors else ""))
+    if latencies:
+        print(f"  Latency:     p50 {percentile(latencies, 50) * 1000:.1f}ms  "
+              f"p99 {percentile(latencies, 99) * 1000:.1f}ms  max {latencies[-1] * 1000:.1f}ms")
+    if devices:
+        found, expected = devices
+        print(f"  Presence:    {found} of {expected} client devices tracked"
+              + ("" if found == expected else "  [!!] clients were merged or dropped"))
+    if ntfy:
+        print(f"  ntfy:        {ntfy.received} notifications received")
+    if broker:
+        print(f"  MQTT:        {broker.published} messages published")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test or replay traffic against the Pi status receiver")
+    parser.add_argument("--target", help="HOST:PORT of a running server (default: launch a local one); "
+                                         "its server.rate_limit applies per source address")
+    parser.add_argument("--ntfy", action="store_true", help="Enable notifications against a local ntfy stand-in")
+    parser.add_argument("--mqtt", action="store_true", help="Enable MQTT against a local mock broker (needs paho-mqtt)")
+    parser.add_argument("--animation-mode", default="pulse", help="Animation mode of the local server (default: pulse)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="Simulated clients")
+    load.add_argument("--clients", type=int, default=10, help="Concurrent clients (default: 10)")
+    load.add_argument("--rate", type=float, default=1.0, help="Requests per second per client (default: 1)")
+    load.add_argument("--duration", type=float, default=10.0, help="Seconds to run (default: 10)")
+    load.add_argument("--users", type=int, default=1,
+                      help="Spread the clients over this many users (default: 1, the primary user; "
+                           f"the server tracks up to {MAX_DEVICES} devices per user)")
+    load.add_argument("--pattern", choices=["flip", "random", "steady"], default="flip",
+                      help="flip: every request changes status; random; steady: never changes (default: flip)")
+
+    replay_cmd = commands.add_parser("replay", help="Replay a server.record_file capture")
+    replay_cmd.add_argument("file", help="Recorded traffic (JSON lines)")
+    replay_cmd.add_argument("--speed", type=float, default=10.0, help="Speed-up factor (default: 10)")
+
+    args = parser.parse_args()
+
+    ntfy = NtfyStandIn() if args.ntfy and not args.target else None
+    broker = MockMqttBroker() if args.mqtt and not args.target else None
+    server = None
+    if args.target:
+        base_url = f"http://{args.target}"
+    else:
+        server = LocalServer(args.animation_mode, ntfy, broker)
+        base_url = f"http://127.0.0.1:{server.port}"
+    url = f"{base_url}/status"
+
+    results = Results()
+    started = time.monotonic()
+    try:
+        devices = None
+        if args.command == "load":
+            run_clients(url, args.clients, args.rate, args.duration, args.pattern, args.users, results)
+        else:
+            replay(url, args.file, args.speed, results)
+        elapsed = time.monotonic() - started
+        if args.command == "load":
+            devices = (loadtest_devices(base_url), expected_devices(args.clients, args.users))
+        time.sleep(0.5)  # Let queued notifications/publishes drain before counting them
+        report(results, elapsed, ntfy, broker, devices)
+    finally:
+        if server:
+            server.close()
+        for service in (ntfy, broker):
+            if service:
+                service.close()
+
+
+if __name__ == "__main__":
+    main()
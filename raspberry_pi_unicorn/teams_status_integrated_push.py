@@ -12,31 +12,51 @@ Features:
 - Push notifications via ntfy.sh
 - Home Assistant MQTT integration
 - Status history and metrics
+
+Startup binds the status receiver first and only imports Flask, paho-mqtt and
+requests when the feature that needs them is enabled.
 """
 
-import unicornhat as unicorn
 from http.server import HTTPServer, BaseHTTPRequestHandler
 import json
 import signal
 import sys
 from colorsys import hsv_to_rgb
 import math
+import multiprocessing
+import queue
+import random
 import threading
 import time
-from datetime import datetime
-from flask import Flask, jsonify, render_template_string, request
-from flask_cors import CORS
-import paho.mqtt.client as mqtt
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from datetime import datetime, timedelta
 import yaml
 import os
+import socket
+import struct
+import gzip
+import hashlib
+import hmac
+import uuid
+
+# Unicorn HAT library is optional: without it the server runs on a virtual display
+try:
+    import unicornhat as unicorn
+except ImportError:
+    unicorn = None
 
 # Load configuration
+def get_config_path():
+    """Config file location (TEAMS_PRESENCE_CONFIG overrides the default)"""
+    return os.environ.get('TEAMS_PRESENCE_CONFIG') or os.path.join(os.path.dirname(__file__), 'config_push.yaml')
+
 def load_config():
     """Load configuration from YAML file"""
-    config_path = os.path.join(os.path.dirname(__file__), 'config_push.yaml')
     try:
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+        with open(get_config_path(), 'r') as f:
+            return yaml.safe_load(f) or {}
     except FileNotFoundError:
         return get_default_config()
 
@@ -44,11 +64,27 @@ def get_default_config():
     """Default configuration"""
     return {
         'server': {
-            'port': 8080  # Receives POST from work PC
+            'port': 8080,  # Receives POST from work PC
+            'record_file': '',  # Append every POST /status here (for load_test.py replay)
+            'udp_port': 0,  # Compact UDP push transport (0 = off)
+            'udp_key': '',  # Shared secret for UDP datagram HMACs
+            'rate_limit': 5.0,  # Sustained POSTs per second per client address
+            'rate_burst': 20,  # POSTs a client may send at once before being limited
+            'max_body': 65536,  # Largest accepted POST body in bytes
+            'read_timeout': 5.0,  # Seconds a client may take to send its request
+            'history_file': 'history.json',  # Status history saved on shutdown ("" = off)
+            'shutdown_timeout': 5.0  # Seconds a shutdown may take before the process is ended
         },
         'unicorn': {
             'brightness': 0.5,
-            'animation_mode': 'pulse'
+            'animation_mode': 'pulse',
+            'transition_duration': 0.25,
+            'backend': 'auto',
+            'capture_file': '',
+            'renderer': 'thread',  # thread, or process: render the LEDs in a separate process
+            'idle_timeout': 1800,  # Seconds without a status change before animations hold a static frame (0 = never)
+            'max_cpu': 50.0,  # Process CPU percent above which the frame rate is reduced
+            'max_temperature': 70.0  # SoC degrees C above which the frame rate is reduced
         },
         'web': {
             'enabled': True,
@@ -69,11 +105,180 @@ def get_default_config():
             'mqtt_password': '',
             'mqtt_topic': 'homeassistant/sensor/teams_presence',
             'discovery_prefix': 'homeassistant'
-        }
+        },
+        'tracing': {
+            'enabled': False,
+            'file': 'traces.jsonl'
+        },
+        'board': {
+            'primary_user': 'default',
+            'max_users': 64
+        },
+        'presence': {
+            'merge_policy': 'most_busy',
+            'device_ttl': 180,
+            'priority': list(DEFAULT_STATUS_PRIORITY)
+        },
+        'animations': {}  # name -> custom animation definition (usable as unicorn.animation_mode)
     }
 
-# Global configuration
-CONFIG = load_config()
+# Most busy first; used by the most_busy merge policy
+DEFAULT_STATUS_PRIORITY = ('DoNotDisturb', 'InACall', 'InAMeeting', 'Busy', 'Available',
+                           'BeRightBack', 'Away', 'Offline', 'Unknown')
+MERGE_POLICIES = ('most_busy', 'latest')
+ANIMATION_MODES = ('solid', 'pulse', 'gradient', 'ripple', 'spinner', 'board')
+MOVING_MODES = ('pulse', 'ripple', 'spinner')  # Modes that keep rendering between status changes
+DISPLAY_BACKENDS = ('auto', 'unicornhat', 'virtual')
+RENDERERS = ('thread', 'process')
+
+class Settings:
+    """Validated, read-only view of the config with derived values precomputed.
+
+    Hot paths read attributes instead of walking the nested config dict, and
+    strings such as the ntfy URL and MQTT topics are built once per load.
+    A reload builds a new Settings and swaps the SETTINGS global in one
+    assignment, so readers always see a consistent version.
+    """
+
+    __slots__ = (
+        'server_port', 'record_file', 'udp_port', 'udp_key', 'history_file', 'shutdown_timeout',
+        'rate_limit', 'rate_burst', 'max_body', 'read_timeout',
+        'brightness', 'animation_mode', 'transition_duration', 'display_backend', 'capture_file',
+        'renderer', 'idle_timeout', 'max_cpu', 'max_temperature',
+        'web_enabled', 'web_host', 'web_port',
+        'notify_enabled', 'notify_only_on_change', 'ntfy_url',
+        'ha_enabled', 'mqtt_broker', 'mqtt_port', 'mqtt_username', 'mqtt_password',
+        'mqtt_state_topic', 'mqtt_attributes_topic', 'mqtt_discovery_topic', 'mqtt_discovery_payload',
+        'trace_enabled', 'trace_file',
+        'primary_user', 'max_users',
+        'merge_policy', 'device_ttl', 'status_rank',
+        'animations'
+    )
+
+    def __init__(self, config):
+        defaults = get_default_config()
+        if not isinstance(config, dict):
+            raise ValueError("the config file must be a mapping of sections")
+        for name in defaults:
+            if not isinstance(config.get(name) or {}, dict):
+                raise ValueError(f"{name} must be a mapping")
+        sections = {name: {**values, **(config.get(name) or {})} for name, values in defaults.items()}
+        server, unicorn_cfg, web = sections['server'], sections['unicorn'], sections['web']
+        notifications, ha, tracing = sections['notifications'], sections['homeassistant'], sections['tracing']
+        board, presence_cfg = sections['board'], sections['presence']
+
+        self.server_port = _port(server['port'], 'server.port')
+        self.record_file = script_relative(server['record_file']) if server['record_file'] else None
+        self.udp_port = _port(server['udp_port'], 'server.udp_port') if server['udp_port'] else None
+        self.udp_key = str(server['udp_key']).encode('utf-8')
+        if self.udp_port and not self.udp_key:
+            raise ValueError("server.udp_key is required when server.udp_port is set")
+        self.rate_limit = float(server['rate_limit'])
+        self.rate_burst = float(server['rate_burst'])
+        if self.rate_limit <= 0 or self.rate_burst < 1:
+            raise ValueError("server.rate_limit must be positive and server.rate_burst at least 1")
+        self.max_body = int(server['max_body'])
+        self.read_timeout = float(server['read_timeout'])
+        if self.max_body < 1024 or self.read_timeout <= 0:
+            raise ValueError("server.max_body must be at least 1024 and server.read_timeout positive")
+        self.history_file = script_relative(server['history_file']) if server['history_file'] else None
+        self.shutdown_timeout = float(server['shutdown_timeout'])
+        if self.shutdown_timeout < 1:
+            raise ValueError("server.shutdown_timeout must be at least 1 second")
+
+        self.brightness = float(unicorn_cfg['brightness'])
+        if not 0.0 <= self.brightness <= 1.0:
+            raise ValueError("unicorn.brightness must be between 0.0 and 1.0")
+        self.animations = compile_animations(sections['animations'])
+        self.animation_mode = unicorn_cfg['animation_mode']
+        if self.animation_mode not in ANIMATION_MODES and self.animation_mode not in self.animations:
+            modes = ', '.join(ANIMATION_MODES + tuple(self.animations))
+            raise ValueError(f"unicorn.animation_mode must be one of: {modes}")
+        self.transition_duration = float(unicorn_cfg['transition_duration'])
+        if self.transition_duration < 0:
+            raise ValueError("unicorn.transition_duration must not be negative")
+        self.display_backend = unicorn_cfg['backend']
+        if self.display_backend not in DISPLAY_BACKENDS:
+            raise ValueError(f"unicorn.backend must be one of: {', '.join(DISPLAY_BACKENDS)}")
+        self.capture_file = script_relative(unicorn_cfg['capture_file']) if unicorn_cfg['capture_file'] else None
+        self.renderer = unicorn_cfg['renderer']
+        if self.renderer not in RENDERERS:
+            raise ValueError(f"unicorn.renderer must be one of: {', '.join(RENDERERS)}")
+        if self.renderer == 'process' and not hasattr(os, 'fork'):
+            raise ValueError("unicorn.renderer: process needs a platform with fork()")
+        self.idle_timeout = float(unicorn_cfg['idle_timeout'])
+        if self.idle_timeout < 0:
+            raise ValueError("unicorn.idle_timeout must not be negative")
+        self.max_cpu = float(unicorn_cfg['max_cpu'])
+        self.max_temperature = float(unicorn_cfg['max_temperature'])
+        if self.max_cpu <= 0 or self.max_temperature <= 0:
+            raise ValueError("unicorn.max_cpu and unicorn.max_temperature must be positive")
+
+        self.web_enabled = bool(web['enabled'])
+        self.web_host = str(web['host'])
+        self.web_port = _port(web['port'], 'web.port')
+
+        self.notify_enabled = bool(notifications['enabled'])
+        self.notify_only_on_change = bool(notifications['only_on_change'])
+        self.ntfy_url = f"{str(notifications['ntfy_server']).rstrip('/')}/{notifications['ntfy_topic']}"
+
+        self.ha_enabled = bool(ha['enabled'])
+        self.mqtt_broker = str(ha['mqtt_broker'])
+        self.mqtt_port = _port(ha['mqtt_port'], 'homeassistant.mqtt_port')
+        self.mqtt_username = ha['mqtt_username'] or None
+        self.mqtt_password = ha['mqtt_password'] or None
+        self.mqtt_state_topic = f"{ha['mqtt_topic']}/state"
+        self.mqtt_attributes_topic = f"{ha['mqtt_topic']}/attributes"
+        self.mqtt_discovery_topic = f"{ha['discovery_prefix']}/sensor/teams_presence/config"
+        self.mqtt_discovery_payload = json.dumps({
+            "name": "Teams Presence Status",
+            "unique_id": "teams_presence_status",
+            "state_topic": self.mqtt_state_topic,
+            "json_attributes_topic": self.mqtt_attributes_topic,
+            "icon": "mdi:microsoft-teams"
+        })
+
+        self.trace_enabled = bool(tracing['enabled'])
+        self.trace_file = script_relative(tracing['file'])
+
+        self.primary_user = str(board['primary_user'])
+        self.max_users = int(board['max_users'])
+        if self.max_users < 1:
+            raise ValueError("board.max_users must be at least 1")
+
+        self.merge_policy = presence_cfg['merge_policy']
+        if self.merge_policy not in MERGE_POLICIES:
+            raise ValueError(f"presence.merge_policy must be one of: {', '.join(MERGE_POLICIES)}")
+        self.device_ttl = float(presence_cfg['device_ttl'])
+        if self.device_ttl <= 0:
+            raise ValueError("presence.device_ttl must be positive")
+        priority = presence_cfg['priority']
+        if (not isinstance(priority, list)
+                or not all(isinstance(status, str) and status in STATUS_COLORS for status in priority)
+                or len(set(priority)) != len(priority)):
+            raise ValueError(f"presence.priority must be a list of distinct statuses from: {', '.join(STATUS_COLORS)}")
+        # Higher rank = busier; statuses missing from the list rank below all listed ones
+        self.status_rank = {status: len(priority) - i for i, status in enumerate(priority)}
+
+    def __setattr__(self, name, value):
+        if hasattr(self, name):
+            raise AttributeError("Settings are read-only; load a new Settings instead")
+        object.__setattr__(self, name, value)
+
+    def mqtt_key(self):
+        """Everything that requires a new MQTT connection when it changes"""
+        return (self.ha_enabled, self.mqtt_broker, self.mqtt_port, self.mqtt_username,
+                self.mqtt_password, self.mqtt_discovery_topic, self.mqtt_discovery_payload)
+
+def script_relative(path):
+    """Resolve a config path relative to this script's directory"""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), str(path))
+
+def _port(value, name):
+    port = int(value)
+    if not 0 < port < 65536:
+        raise ValueError(f"{name} must be a TCP port (1-65535)")
+    return port
 
 # Teams status color mapping (RGB values)
 STATUS_COLORS = {
@@ -101,6 +306,216 @@ STATUS_EMOJI = {
     "Unknown": "[??]",
 }
 
+# ============================================================================
+# CUSTOM ANIMATIONS (animations: section, compiled at config load)
+# ============================================================================
+
+ANIMATION_MATRIX = (8, 8)  # Width, height the custom animations are compiled for
+MAX_ANIMATION_FPS = 30
+MAX_ANIMATION_DURATION = 10.0
+MAX_COMPILED_FRAMES = 2000  # All custom animations together (~600 bytes per frame)
+ANIMATION_FIELDS = ('duration', 'fps', 'easing', 'keyframes', 'mask', 'background', 'pattern', 'spread', 'statuses')
+
+EASINGS = {
+    'linear': lambda t: t,
+    'ease_in': lambda t: t * t,
+    'ease_out': lambda t: 1 - (1 - t) * (1 - t),
+    'ease_in_out': lambda t: t * t * (3 - 2 * t),
+    'step': lambda t: 0.0,  # Hold each keyframe until the next one
+}
+
+# Where each pixel is in the cycle, 0..1, scaled by spread
+PHASE_PATTERNS = {
+    'uniform': lambda x, y, w, h: 0.0,
+    'horizontal': lambda x, y, w, h: x / max(w - 1, 1),
+    'vertical': lambda x, y, w, h: y / max(h - 1, 1),
+    'diagonal': lambda x, y, w, h: (x + y) / max(w + h - 2, 1),
+    'radial': lambda x, y, w, h: math.hypot(x - (w - 1) / 2, y - (h - 1) / 2) / math.hypot((w - 1) / 2, (h - 1) / 2),
+}
+
+MASKS = {
+    'all': lambda x, y, w, h: True,
+    'border': lambda x, y, w, h: x in (0, w - 1) or y in (0, h - 1),
+    'center': lambda x, y, w, h: w // 4 <= x < w - w // 4 and h // 4 <= y < h - h // 4,
+    'checker': lambda x, y, w, h: (x + y) % 2 == 0,
+    'cross': lambda x, y, w, h: x in (w // 2 - 1, w // 2) or y in (h // 2 - 1, h // 2),
+}
+
+class AnimationProgram:
+    """Precomputed frames (tuples of RGB pixels, row by row) of one animation for one status color"""
+
+    __slots__ = ('frames', 'duration')
+
+    def __init__(self, frames, duration):
+        self.frames = frames
+        self.duration = duration
+
+class Animation:
+    """A compiled animations: entry, one program per status"""
+
+    def __init__(self, programs):
+        self.programs = programs
+
+    def program(self, status):
+        return self.programs.get(status) or self.programs['Unknown']
+
+def compile_animations(specs):
+    """animations: section -> {name: Animation}; ValueError for an invalid definition"""
+    if not isinstance(specs, dict):
+        raise ValueError("animations must map names to definitions")
+    budget = [MAX_COMPILED_FRAMES]
+    compiled = {}
+    for name, spec in specs.items():
+        if name in ANIMATION_MODES:
+            raise ValueError(f"animations.{name}: name is taken by a built-in animation mode")
+        compiled[str(name)] = compile_animation(f"animations.{name}", spec, budget)
+    return compiled
+
+def compile_animation(where, spec, budget):
+    base = animation_spec(where, spec, None)
+    overrides = spec.get('statuses') or {}
+    if not isinstance(overrides, dict) or not set(overrides) <= set(STATUS_COLORS):
+        raise ValueError(f"{where}.statuses must map status names ({', '.join(STATUS_COLORS)}) to overrides")
+    resolved = {status: animation_spec(f"{where}.statuses.{status}", override, base)
+                for status, override in overrides.items()}
+    programs = {}
+    shared = {}  # Statuses with the same color and definition share one program
+    for status, color in STATUS_COLORS.items():
+        status_spec = resolved.get(status, base)
+        key = (id(status_spec), color)
+        if key not in shared:
+            shared[key] = render_program(where, status_spec, color, budget)
+        programs[status] = shared[key]
+    return Animation(programs)
+
+def animation_spec(where, spec, inherited):
+    """Validate one definition (or per-status override) and fill in defaults or inherited fields"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"{where} must be a mapping")
+    unknown = set(spec) - set(ANIMATION_FIELDS)
+    if unknown or (inherited and 'statuses' in spec):
+        raise ValueError(f"{where}: unknown field(s) {', '.join(sorted(map(str, unknown))) or 'statuses'}")
+    result = dict(inherited) if inherited else {
+        'duration': 2.0, 'fps': 20, 'easing': EASINGS['linear'], 'keyframes': ((0.0, 1.0, None),),
+        'mask': MASKS['all'], 'background': (0, 0, 0), 'pattern': PHASE_PATTERNS['uniform'], 'spread': 0.0,
+    }
+    try:
+        if 'duration' in spec:
+            result['duration'] = float(spec['duration'])
+            if not 0 < result['duration'] <= MAX_ANIMATION_DURATION:
+                raise ValueError(f"duration must be between 0 and {MAX_ANIMATION_DURATION} seconds")
+        if 'fps' in spec:
+            result['fps'] = int(spec['fps'])
+            if not 1 <= result['fps'] <= MAX_ANIMATION_FPS:
+                raise ValueError(f"fps must be between 1 and {MAX_ANIMATION_FPS}")
+        if 'easing' in spec:
+            result['easing'] = choice('easing', spec['easing'], EASINGS)
+        if 'pattern' in spec:
+            result['pattern'] = choice('pattern', spec['pattern'], PHASE_PATTERNS)
+        if 'spread' in spec:
+            result['spread'] = float(spec['spread'])
+            if not 0 <= result['spread'] <= 1:
+                raise ValueError("spread must be between 0 and 1")
+        if 'background' in spec:
+            result['background'] = parse_color(spec['background'])
+        if 'mask' in spec:
+            result['mask'] = parse_mask(spec['mask'])
+        if 'keyframes' in spec:
+            result['keyframes'] = parse_keyframes(spec['keyframes'])
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{where}: {e}") from None
+    return result
+
+def choice(field, value, options):
+    if value not in options:
+        raise ValueError(f"{field} must be one of: {', '.join(options)}")
+    return options[value]
+
+def parse_color(value):
+    """"#rrggbb" or [r, g, b] -> (r, g, b)"""
+    if isinstance(value, str) and len(value) == 7 and value.startswith('#'):
+        return tuple(int(value[i:i + 2], 16) for i in (1, 3, 5))
+    if isinstance(value, (list, tuple)) and len(value) == 3 and all(isinstance(c, int) and 0 <= c <= 255 for c in value):
+        return tuple(value)
+    raise ValueError(f"{value!r} is not a color (\"#rrggbb\" or [r, g, b])")
+
+def parse_mask(value):
+    """Mask name, or one string per row with # for lit and . for dark pixels"""
+    if isinstance(value, str):
+        return choice('mask', value, MASKS)
+    width, height = ANIMATION_MATRIX
+    if (not isinstance(value, list) or len(value) != height
+            or not all(isinstance(row, str) and len(row) == width and set(row) <= set('#.') for row in value)):
+        raise ValueError(f"mask must be one of: {', '.join(MASKS)}, or {height} rows of {width} '#'/'.' characters")
+    return lambda x, y, w, h: value[y][x] == '#'
+
+def parse_keyframes(value):
+    """[{at: 0..1, brightness: 0..1, color: optional}] -> sorted (at, brightness, color or None)"""
+    if not isinstance(value, list) or not value:
+        raise ValueError("keyframes must be a non-empty list")
+    keyframes = []
+    for keyframe in value:
+        if not isinstance(keyframe, dict) or not set(keyframe) <= {'at', 'brightness', 'color'}:
+            raise ValueError("each keyframe takes at, brightness and color")
+        at = float(keyframe.get('at', 0.0))
+        brightness = float(keyframe.get('brightness', 1.0))
+        if not (0 <= at <= 1 and 0 <= brightness <= 1):
+            raise ValueError("keyframe at and brightness must be between 0 and 1")
+        color = parse_color(keyframe['color']) if 'color' in keyframe else None
+        keyframes.append((at, brightness, color))
+    return tuple(sorted(keyframes, key=lambda k: k[0]))
+
+def keyframe_color(keyframes, easing, phase, base):
+    """Color at phase (0..1) of the keyframe curve; keyframes without a color use base"""
+    if phase <= keyframes[0][0]:
+        before = after = keyframes[0]
+        t = 0.0
+    elif phase >= keyframes[-1][0]:
+        before = after = keyframes[-1]
+        t = 0.0
+    else:
+        index = next(i for i, keyframe in enumerate(keyframes) if keyframe[0] >= phase)
+        before, after = keyframes[index - 1], keyframes[index]
+        t = easing((phase - before[0]) / (after[0] - before[0]))
+    brightness = before[1] + (after[1] - before[1]) * t
+    start, end = before[2] or base, after[2] or base
+    return tuple(int((a + (b - a) * t) * brightness) for a, b in zip(start, end))
+
+def render_program(where, spec, base, budget):
+    """Render every frame of one loop.
+
+    The keyframe curve is sampled once per frame; each pixel then plays it
+    shifted by its pattern offset, so a frame is only table lookups. Loops
+    whose frames are all identical are stored as a single static frame.
+    """
+    count = max(1, round(spec['duration'] * spec['fps']))
+    width, height = ANIMATION_MATRIX
+    curve = [keyframe_color(spec['keyframes'], spec['easing'], i / count, base) for i in range(count)]
+    pixels = [(x, y) for y in range(height) for x in range(width)]
+    offsets = [round(spec['pattern'](x, y, width, height) * spec['spread'] * count) for x, y in pixels]
+    lit = [spec['mask'](x, y, width, height) for x, y in pixels]
+    background = spec['background']
+
+    frames = []
+    for i in range(count):
+        frames.append(tuple(curve[(i - offset) % count] if on else background for offset, on in zip(offsets, lit)))
+    if all(frame == frames[0] for frame in frames):
+        frames = frames[:1]
+    budget[0] -= len(frames)
+    if budget[0] < 0:
+        raise ValueError(f"{where}: custom animations need more than {MAX_COMPILED_FRAMES} frames in total; "
+                         f"lower duration or fps")
+    return AnimationProgram(tuple(frames), spec['duration'])
+
+# Global configuration (swapped atomically by the config watcher)
+try:
+    SETTINGS = Settings(load_config())
+except (TypeError, ValueError) as e:
+    print(f"Error: invalid configuration in {get_config_path()}: {e}")
+    sys.exit(1)
+CONFIG_POLL_INTERVAL = 2.0  # Seconds between config file checks
+SERVE_POLL_INTERVAL = 0.05  # Seconds between serve_forever() shutdown checks (bounds time to stop)
+
 # Global state
 current_status = {
     'availability': 'Unknown',
@@ -108,70 +523,1079 @@ current_status = {
     'last_change': datetime.now().isoformat(),
     'uptime_seconds': 0
 }
-status_history = []
-MAX_HISTORY = 100
+MAX_BACKFILL = 500  # Transitions per POST /history
+MAX_CLIENT_CLOCK_SKEW = timedelta(minutes=5)
+server_started_us = int(time.time() * 1000000)  # Floor for a live push's changed_at (POST /history backfills earlier)
 shutdown_flag = False
+shutdown_started = None  # time.monotonic() of the first SIGINT/SIGTERM
+status_event = threading.Event()  # Set when current_status or SETTINGS changes, wakes the renderer
+status_change = None  # (time.monotonic() received, Trace or None) of the last status change
 animation_thread = None
-mqtt_client = None
+renderer = None  # RendererProcess when unicorn.renderer is process
+renderer_board = None  # In the renderer process: (version, colors) of the board as sent by the server
+mqtt_client = None  # MqttSession while Home Assistant is enabled
 httpd = None
+udp_sock = None
+web_server = None
+update_lock = threading.Lock()  # Serializes status updates from HTTP, UDP and the presence sweeper
+side_effects = queue.Queue()  # (function, args) run off the request path by dispatch_side_effects
 
-# Flask web server
-app = Flask(__name__)
-CORS(app)
+# ============================================================================
+# STATUS HISTORY (primary user, compact ring buffer)
+# ============================================================================
+
+MAX_HISTORY = 20000  # About 9 bytes each: weeks of transitions in under 200 KB
+HISTORY_API_ROWS = 100  # Default number of entries returned by /api/history
+HISTORY_STATUSES = tuple(STATUS_COLORS)  # Code -> status; only known statuses are ever recorded
+HISTORY_CODES = {status: code for code, status in enumerate(HISTORY_STATUSES)}
+
+class StatusHistory:
+    """Ring buffer of (status, time) transitions in two array columns.
 
-# Import status update notifications
-import requests as http_requests
+    Statuses are one-byte codes into HISTORY_STATUSES and times are
+    int64 epoch microseconds, about 9 bytes per entry instead of a dict
+    with two strings. Appends are O(1) and overwrite the oldest entry once
+    the buffer is full. Readers index the columns directly (or take array
+    slices), so nothing is allocated per stored entry.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.codes = array('B', bytes(capacity))
+        self.times = array('q', bytes(8 * capacity))
+        self.start = 0  # Slot of the oldest entry
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, status, epoch_us):
+        slot = (self.start + self.count) % self.capacity
+        self.codes[slot] = HISTORY_CODES[status]
+        self.times[slot] = epoch_us
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def columns(self, first=0):
+        """(codes, times) arrays of the entries from index first (0 = oldest) on"""
+        first = min(max(first, 0), self.count)
+        begin = self.start + first
+        end = self.start + self.count
+        capacity = self.capacity
+        if begin >= capacity:
+            return self.codes[begin - capacity:end - capacity], self.times[begin - capacity:end - capacity]
+        if end <= capacity:
+            return self.codes[begin:end], self.times[begin:end]
+        return (self.codes[begin:] + self.codes[:end - capacity],
+                self.times[begin:] + self.times[:end - capacity])
+
+    def __reversed__(self):
+        """(status, epoch microseconds), newest first"""
+        for i in range(self.count - 1, -1, -1):
+            slot = (self.start + i) % self.capacity
+            yield HISTORY_STATUSES[self.codes[slot]], self.times[slot]
+
+    def entries(self):
+        """[(status, epoch microseconds)], oldest first"""
+        codes, times = self.columns()
+        statuses = HISTORY_STATUSES
+        return [(statuses[code], epoch_us) for code, epoch_us in zip(codes, times)]
+
+    def merge(self, entries):
+        """Merge (status, epoch microseconds) transitions in; returns those that were new"""
+        existing = self.entries()
+        known = set(existing)
+        self.start = self.count = 0
+        for status, epoch_us in merge_history(existing, entries)[-self.capacity:]:
+            self.append(status, epoch_us)
+        return [entry for entry in entries if entry not in known]
+
+def epoch_us(timestamp):
+    """Local ISO time -> epoch microseconds"""
+    moment = datetime.fromisoformat(timestamp)
+    return int(moment.timestamp()) * 1000000 + moment.microsecond
+
+def iso_from_us(epoch_us):
+    """Epoch microseconds -> local ISO time"""
+    return datetime.fromtimestamp(epoch_us // 1000000).replace(microsecond=epoch_us % 1000000).isoformat()
+
+status_history = StatusHistory(MAX_HISTORY)
+
+# ============================================================================
+# PRESENCE TABLE (one entry per user, for the team board)
+# ============================================================================
+
+USER_HISTORY = 20  # Transitions kept per user
+MAX_USER_ID_LENGTH = 64
+MAX_DEVICES = 16  # Devices tracked per user; the least recently seen is dropped
+PRESENCE_SWEEP_INTERVAL = 5.0  # Seconds between checks for expired devices
+
+class UserPresence:
+    """Merged status and recent transitions of one user.
+
+    devices maps device_id -> [availability, last seen, last changed]
+    (monotonic seconds). expires is the earliest time a device drops out of
+    the merge, so the sweeper only recomputes users that can change.
+    """
+
+    __slots__ = ('user_id', 'availability', 'last_change', 'last_seen', 'history', 'devices', 'expires')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.availability = 'Unknown'
+        self.last_change = None
+        self.last_seen = None
+        self.history = deque(maxlen=USER_HISTORY)
+        self.devices = {}
+        self.expires = math.inf
+
+class PresenceTable:
+    """Users keyed by client-supplied ID, in first-seen order (= tile order).
+
+    Each user may push from several devices; their statuses are merged with
+    the configured policy, ignoring devices silent for longer than
+    presence.device_ttl (unless every device is). Merging is O(devices) and
+    only runs when a device changes, appears or expires.
+
+    Written by the receiver and the sweeper, read by the renderer and
+    dashboard; version is bumped on every change so readers can cheaply tell
+    whether to redraw.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = {}
+        self.order = []
+        self.version = 0
+
+    def _user(self, user_id, settings):
+        user = self.users.get(user_id)
+        if user is None:
+            if len(self.users) >= settings.max_users:
+                raise ValueError(f"board is full ({settings.max_users} users)")
+            user = self.users[user_id] = UserPresence(user_id)
+            self.order.append(user)
+        return user
+
+    def update(self, user_id, device_id, availability, timestamp, now):
+        """Store a device's status; returns (merged, previous merged) or None if unchanged.
+
+        timestamp is when the status changed (the client's log time if it
+        sent one) and is what a resulting history entry records.
+        """
+        settings = SETTINGS
+        with self.lock:
+            user = self._user(user_id, settings)
+            user.last_seen = datetime.now().isoformat()
+
+            device = user.devices.get(device_id)
+            if device is None:
+                if len(user.devices) >= MAX_DEVICES:
+                    del user.devices[min(user.devices, key=lambda d: user.devices[d][1])]
+                user.devices[device_id] = [availability, now, now]
+            else:
+                was_expired = now - device[1] > settings.device_ttl
+                device[1] = now
+                if device[0] == availability and not was_expired:
+                    return None  # Heartbeat: nothing to re-merge
+                if device[0] != availability:
+                    device[0] = availability
+                    device[2] = now
+            return self._merge(user, timestamp, now, settings)
+
+    def sweep(self, now):
+        """Re-merge users whose devices expired; returns [(user_id, merged, previous)]"""
+        settings = SETTINGS
+        changes = []
+        with self.lock:
+            timestamp = datetime.now().isoformat()
+            for user in self.order:
+                if user.expires <= now:
+                    result = self._merge(user, timestamp, now, settings)
+                    if result:
+                        changes.append((user.user_id,) + result)
+        return changes
+
+    def _merge(self, user, timestamp, now, settings):
+        devices = user.devices.values()
+        live = [d for d in devices if now - d[1] <= settings.device_ttl]
+        if not live:
+            live = [max(devices, key=lambda d: d[1])]  # Everyone is stale: trust the last word
+        if settings.merge_policy == 'most_busy':
+            rank = settings.status_rank
+            merged = max(live, key=lambda d: (rank.get(d[0], 0), d[2]))[0]
+        else:
+            merged = max(live, key=lambda d: d[2])[0]
+        user.expires = min(d[1] for d in live) + settings.device_ttl if len(devices) > 1 else math.inf
+
+        if merged == user.availability:
+            return None
+        previous = user.availability
+        user.availability = merged
+        user.last_change = timestamp
+        user.history.append((merged, timestamp))
+        self.version += 1
+        return merged, previous
+
+    def backfill(self, user_id, entries):
+        """Merge (status, timestamp) transitions a client missed into a user's history"""
+        with self.lock:
+            user = self._user(user_id, SETTINGS)
+            user.history = deque(merge_history(user.history, entries)[-USER_HISTORY:], maxlen=USER_HISTORY)
+            self.version += 1
+
+    def colors(self):
+        """(version, [status color per user in tile order])"""
+        with self.lock:
+            return self.version, [STATUS_COLORS.get(u.availability, STATUS_COLORS["Unknown"]) for u in self.order]
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self.lock:
+            return [{
+                'user_id': u.user_id,
+                'availability': u.availability,
+                'emoji': STATUS_EMOJI.get(u.availability, '[??]'),
+                'last_change': u.last_change,
+                'last_seen': u.last_seen,
+                'devices': [{
+                    'device_id': device_id,
+                    'availability': availability,
+                    'seen_seconds_ago': round(now - seen, 1)
+                } for device_id, (availability, seen, _) in u.devices.items()]
+            } for u in self.order]
+
+    def history(self, user_id):
+        with self.lock:
+            user = self.users.get(user_id)
+            if user is None:
+                return None
+            return [{'status': status, 'timestamp': timestamp} for status, timestamp in user.history]
+
+def merge_history(existing, entries):
+    """Time-ordered union of (status, timestamp) transitions, without repeats of the same status"""
+    merged = []
+    for status, timestamp in sorted(set(existing) | set(entries), key=lambda e: e[1]):
+        if not merged or merged[-1][0] != status:
+            merged.append((status, timestamp))
+    return merged
+
+presence = PresenceTable()
+
+# ============================================================================
+# TIMELINE ROLLUPS
+# ============================================================================
+
+# name -> (bucket seconds, buckets kept): 24 hours, 7 days, 31 days, a year
+TIMELINE_RESOLUTIONS = {
+    '1m': (60, 1440),
+    '15m': (900, 672),
+    '1h': (3600, 744),
+    '1d': (86400, 366),
+}
+MAX_TIMELINE_TRANSITIONS = 20000  # Kept to place late (backfilled) transitions
+
+class Timeline:
+    """Seconds per status in fixed time buckets, at several resolutions.
+
+    Buckets are updated incrementally when a transition arrives: the
+    interval the previous status covered is spread over the buckets it
+    overlaps. A late transition (backfill) moves the part of the interval it
+    splits off from the old status to its own. The still-open interval of
+    the current status is only added when reading, so nothing ticks in the
+    background. Buckets line up with local midnight.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {name: {} for name in TIMELINE_RESOLUTIONS}  # name -> {bucket start: {status: seconds}}
+        self.times = []  # Transition epochs, sorted
+        self.statuses = []
+        self.version = 0
+        self.svg_cache = {}  # name -> (version, current bucket, svg)
+
+    def add(self, epoch, status):
+        with self.lock:
+            i = bisect_right(self.times, epoch)
+            if i < len(self.times):
+                # Late transition: it takes over [epoch, next transition) from the status before it
+                if i:
+                    self._spread(self.statuses[i - 1], epoch, self.times[i], -1)
+                self._spread(status, epoch, self.times[i], 1)
+            elif i:
+                self._spread(self.statuses[-1], self.times[-1], epoch, 1)
+            self.times.insert(i, epoch)
+            self.statuses.insert(i, status)
+            if len(self.times) > MAX_TIMELINE_TRANSITIONS:
+                del self.times[0], self.statuses[0]
+            self.version += 1
+
+    def _spread(self, status, start, end, sign):
+        now = time.time()
+        for name, (size, keep) in TIMELINE_RESOLUTIONS.items():
+            buckets = self.buckets[name]
+            horizon = bucket_start(now, size) - (keep - 1) * size
+            bucket = bucket_start(max(start, horizon), size)
+            while bucket < end:
+                overlap = min(end, bucket + size) - max(start, bucket)
+                if overlap > 0:
+                    seconds = buckets.setdefault(bucket, {})
+                    seconds[status] = seconds.get(status, 0) + sign * overlap
+                bucket += size
+            if len(buckets) > keep:
+                for old in [b for b in buckets if b < horizon]:
+                    del buckets[old]
+
+    def query(self, name):
+        """[(bucket start, {status: seconds})] oldest first, including the open interval"""
+        size, keep = TIMELINE_RESOLUTIONS[name]
+        now = time.time()
+        horizon = bucket_start(now, size) - (keep - 1) * size
+        with self.lock:
+            result = {b: dict(seconds) for b, seconds in self.buckets[name].items() if b >= horizon}
+            if self.times:
+                start, status = max(self.times[-1], horizon), self.statuses[-1]
+                bucket = bucket_start(start, size)
+                while bucket < now:
+                    overlap = min(now, bucket + size) - max(start, bucket)
+                    seconds = result.setdefault(bucket, {})
+                    seconds[status] = seconds.get(status, 0) + overlap
+                    bucket += size
+        return sorted((b, seconds) for b, seconds in result.items() if any(v > 0.5 for v in seconds.values()))
+
+    def sparkline(self, name):
+        """SVG strip, one column per bucket in the colour of its main status.
+
+        Cached until the next transition or until a new bucket starts.
+        """
+        size, keep = TIMELINE_RESOLUTIONS[name]
+        current = bucket_start(time.time(), size)
+        cached = self.svg_cache.get(name)
+        if cached and cached[0] == self.version and cached[1] == current:
+            return cached[2]
+
+        first = current - (keep - 1) * size
+        rects = []
+        run_start, run_status = None, None
+        for bucket, seconds in self.query(name) + [(None, {})]:
+            status = max(seconds, key=seconds.get) if seconds else None
+            column = None if bucket is None else (bucket - first) // size
+            if run_status is not None and (status != run_status or column != run_end + 1):
+                color = rgb_to_hex(STATUS_COLORS.get(run_status, STATUS_COLORS['Unknown']))
+                rects.append(f'<rect x="{run_start}" y="0" width="{run_end - run_start + 1}" height="1" fill="{color}"/>')
+                run_status = None
+            if status is not None:
+                if run_status is None:
+                    run_start, run_status = column, status
+                run_end = column
+        svg = (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {keep} 1" preserveAspectRatio="none">'
+               + "".join(rects) + '</svg>')
+        self.svg_cache[name] = (self.version, current, svg)
+        return svg
+
+def bucket_start(epoch, size):
+    """Start of the bucket holding epoch, aligned to local midnight"""
+    offset = time.localtime(epoch).tm_gmtoff
+    return int(epoch - (epoch + offset) % size)
+
+timeline = Timeline()
+
+# ============================================================================
+# METRICS (Prometheus text format at GET /metrics on the status port)
+# ============================================================================
+
+class Counter:
+    """Monotonic counter.
+
+    Every metric has exactly one writer thread (receiver, renderer or side-effect
+    dispatcher), so increments need no lock; /metrics only reads.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+class Histogram:
+    """Fixed-bucket latency histogram in seconds (single writer, like Counter)"""
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Metrics:
+    """All server metrics, rendered on demand by GET /metrics"""
+
+    KNOWN_PATHS = ('/', '/status', '/history', '/users', '/metrics')  # Anything else is counted as "other"
+
+    def __init__(self):
+        self.started = time.time()
+        self.http_requests = {}  # (method, path) -> Counter
+        self.http_errors = {}  # (method, path) -> Counter
+        self.status_post_seconds = Histogram()
+        self.frame_render_seconds = Histogram()
+        self.status_to_pixel_seconds = Histogram()
+        self.ntfy_seconds = Histogram()
+        self.ntfy_failures = Counter()
+        self.mqtt_seconds = Histogram()
+        self.mqtt_failures = Counter()
+        self.udp_packets = {}  # result -> Counter, written by the UDP receiver only
+
+    def count_udp(self, result):
+        counter = self.udp_packets.get(result)
+        if counter is None:
+            counter = self.udp_packets[result] = Counter()
+        counter.inc()
+
+    def count_request(self, method, path, code):
+        key = (method, path if path in self.KNOWN_PATHS else 'other')
+        counter = self.http_requests.get(key)
+        if counter is None:
+            counter = self.http_requests[key] = Counter()
+            self.http_errors[key] = Counter()
+        counter.inc()
+        if code >= 400:
+            self.http_errors[key].inc()
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        def histogram(name, help_text, hist):
+            samples = []
+            cumulative = 0
+            for bound, count in zip(hist.buckets, hist.counts):
+                cumulative += count
+                samples.append((f'_bucket{{le="{bound}"}}', cumulative))
+            samples.append(('_bucket{le="+Inf"}', cumulative + hist.counts[-1]))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for suffix, value in samples:
+                lines.append(f"{name}{suffix} {value}")
+            lines.append(f"{name}_sum {hist.sum:.6f}")
+            lines.append(f"{name}_count {hist.count}")
+
+        def by_request(counters):
+            return [(f'{{method="{method}",path="{path}"}}', counter.value)
+                    for (method, path), counter in list(counters.items())]
+
+        metric('teams_presence_http_requests_total', 'counter', 'Requests handled by the status receiver',
+               by_request(self.http_requests))
+        metric('teams_presence_http_errors_total', 'counter', 'Receiver responses with status >= 400',
+               by_request(self.http_errors))
+        histogram('teams_presence_status_post_seconds', 'POST /status handling time', self.status_post_seconds)
+        clients = rate_limiter.counts()
+        metric('teams_presence_client_posts_total', 'counter', 'POSTs accepted per client address',
+               [(f'{{client="{address}"}}', allowed) for address, allowed, _ in clients])
+        metric('teams_presence_client_rate_limited_total', 'counter', 'POSTs answered 429 per client address',
+               [(f'{{client="{address}"}}', limited) for address, _, limited in clients])
+        if self.udp_packets:
+            metric('teams_presence_udp_packets_total', 'counter', 'UDP status datagrams by result',
+                   [(f'{{result="{result}"}}', counter.value) for result, counter in list(self.udp_packets.items())])
+
+        histogram('teams_presence_frame_render_seconds', 'Time to render one animation frame',
+                  self.frame_render_seconds)
+        histogram('teams_presence_status_to_pixel_seconds', 'Time from POST receipt to first frame of the new status',
+                  self.status_to_pixel_seconds)
+        animation = animation_snapshot()
+        if animation:
+            metric('teams_presence_frames_rendered_total', 'counter', 'Animation frames rendered',
+                   [('', animation['frames_rendered'])])
+            metric('teams_presence_frames_dropped_total', 'counter', 'Animation frames skipped to keep to schedule',
+                   [('', animation['frames_dropped'])])
+            metric('teams_presence_display_writes_total', 'counter', 'Frames written to the LEDs',
+                   [('', animation['display']['writes'])])
+            metric('teams_presence_display_skipped_total', 'counter', 'Unchanged frames not written to the LEDs',
+                   [('', animation['display']['skipped'])])
+
+        histogram('teams_presence_ntfy_delivery_seconds', 'ntfy notification delivery time', self.ntfy_seconds)
+        metric('teams_presence_ntfy_failures_total', 'counter', 'ntfy notifications that failed',
+               [('', self.ntfy_failures.value)])
+        histogram('teams_presence_mqtt_publish_seconds', 'MQTT status publish time', self.mqtt_seconds)
+        metric('teams_presence_mqtt_failures_total', 'counter', 'MQTT publishes not sent right away (buffered or failed)',
+               [('', self.mqtt_failures.value)])
+        session = mqtt_client
+        if session:
+            mqtt = session.snapshot()
+            metric('teams_presence_mqtt_connected', 'gauge', '1 while connected to the MQTT broker',
+                   [('', int(mqtt['connected']))])
+            metric('teams_presence_mqtt_connects_total', 'counter', 'Successful MQTT (re)connects',
+                   [('', mqtt['connects'])])
+            metric('teams_presence_mqtt_buffered_messages', 'gauge', 'Retained MQTT messages waiting for a reconnect',
+                   [('', mqtt['buffered'])])
+        metric('teams_presence_dispatch_queue_depth', 'gauge', 'Side effects waiting to be dispatched',
+               [('', side_effects.qsize())])
+
+        rss = process_rss_bytes()
+        if rss is not None:
+            metric('process_resident_memory_bytes', 'gauge', 'Resident memory size in bytes', [('', rss)])
+        metric('process_cpu_seconds_total', 'counter', 'User and system CPU time spent in seconds',
+               [('', round(process_cpu_seconds(), 3))])
+        if animation:
+            state = animation['power']
+            metric('teams_presence_cpu_percent', 'gauge', 'Renderer CPU use over the last sample interval',
+                   [('', state['cpu_percent'])])
+            if state['temperature_c'] is not None:
+                metric('teams_presence_soc_temperature_celsius', 'gauge', 'SoC temperature',
+                       [('', state['temperature_c'])])
+            metric('teams_presence_frame_stride', 'gauge', 'Frames advanced per rendered frame (1 = full rate)',
+                   [('', state['frame_stride'])])
+            metric('teams_presence_display_idle', 'gauge', '1 while animations hold a static frame',
+                   [('', int(state['idle']))])
+        metric('process_start_time_seconds', 'gauge', 'Start time of the process since the epoch',
+               [('', round(self.started, 3))])
+        return "\n".join(lines) + "\n"
+
+def process_rss_bytes():
+    """Current resident set size from /proc (None where unavailable)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+metrics = Metrics()
+
+# ============================================================================
+# END-TO-END TRACING (log line -> push -> receiver -> LEDs / MQTT / ntfy)
+# ============================================================================
+
+class Trace:
+    """Stage timings of one status change, in ms after the POST was received"""
+
+    __slots__ = ('trace_id', 'status', 'received', 'received_at', 'client', 'stages', 'failed', 'pending')
+
+    def __init__(self, trace_id, status, received, client):
+        self.trace_id = trace_id
+        self.status = status
+        self.received = received
+        self.received_at = time.time()
+        self.client = client
+        self.stages = {}
+        self.failed = []
+        self.pending = set()
+
+class Tracer:
+    """Collects traces and appends finished ones to the JSONL trace file.
+
+    A trace is finished once every side effect it waits for (first frame,
+    MQTT publish, ntfy delivery) has reported, or after TIMEOUT seconds.
+    """
+
+    TIMEOUT = 30.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = []
+
+    def start(self, data, status, received):
+        """Begin a trace for a status change; None when tracing is off"""
+        settings = SETTINGS
+        if not settings.trace_enabled:
+            return None
+        client_trace = data.get('trace') if isinstance(data.get('trace'), dict) else {}
+        trace_id = str(client_trace.get('id') or uuid.uuid4().hex[:16])
+        trace = Trace(trace_id, status, received, client_timings(client_trace, data.get('timestamp')))
+        trace.pending.add('first_frame')
+        if mqtt_client:
+            trace.pending.add('mqtt_published')
+        if settings.notify_enabled:
+            trace.pending.add('ntfy_delivered')
+        with self.lock:
+            self.expire(received)
+            self.active.append(trace)
+        return trace
+
+    def mark(self, trace, stage, ok=True):
+        """Record that a stage of trace finished (ok=False for a failed side effect)"""
+        if trace is None:
+            return
+        elapsed_ms = round((time.monotonic() - trace.received) * 1000, 3)
+        with self.lock:
+            if stage in trace.stages:
+                return
+            trace.stages[stage] = elapsed_ms
+            if not ok:
+                trace.failed.append(stage)
+            trace.pending.discard(stage)
+            if not trace.pending and trace in self.active:
+                self.active.remove(trace)
+                self.write(trace)
+
+    def flush(self):
+        """Write out every unfinished trace (on shutdown)"""
+        with self.lock:
+            for trace in self.active:
+                self.write(trace)
+            self.active.clear()
+
+    def expire(self, now):
+        """Write out traces still waiting on a side effect after TIMEOUT"""
+        for trace in [t for t in self.active if now - t.received > self.TIMEOUT]:
+            self.active.remove(trace)
+            self.write(trace)
+
+    def write(self, trace):
+        record = {
+            'trace_id': trace.trace_id,
+            'status': trace.status,
+            'received_at': datetime.fromtimestamp(trace.received_at).isoformat(),
+            'client': trace.client,
+            'server': trace.stages,
+        }
+        if trace.failed:
+            record['failed'] = trace.failed
+        if trace.pending:
+            record['timed_out'] = sorted(trace.pending)
+        try:
+            with open(SETTINGS.trace_file, 'a') as f:
+                f.write(json.dumps(record, separators=(',', ':')) + "\n")
+        except OSError:
+            pass  # Tracing must never take the receiver down
+
+def client_timings(client_trace, client_timestamp):
+    """Client-side stages from the push payload.
+
+    scan_ms (log read) and detect_to_push_ms are measured on the client's
+    monotonic clock. network_ms
+    compares the client's wall clock with ours, so it includes any clock skew.
+    """
+    timings = {}
+    for stage in ('scan_ms', 'detect_to_push_ms'):
+        value = client_trace.get(stage)
+        if isinstance(value, (int, float)):
+            timings[stage] = round(value, 3)
+    pushed_at = client_trace.get('pushed_at')
+    if not isinstance(pushed_at, (int, float)) and client_timestamp:
+        try:
+            pushed_at = datetime.fromisoformat(str(client_timestamp)).timestamp()
+        except ValueError:
+            pushed_at = None
+    if isinstance(pushed_at, (int, float)):
+        timings['network_ms'] = round((time.time() - pushed_at) * 1000, 3)
+    return timings
+
+tracer = Tracer()
+
+# ============================================================================
+# DISPLAY BACKENDS
+# ============================================================================
+
+class UnicornHatBackend:
+    """Pimoroni Unicorn HAT"""
+
+    name = "Unicorn HAT"
+
+    def __init__(self):
+        unicorn.set_layout(unicorn.HAT)
+        unicorn.rotation(0)
+        self.width, self.height = unicorn.get_shape()
+
+    def brightness(self, level):
+        unicorn.brightness(level)
+
+    def set_pixel(self, x, y, r, g, b):
+        unicorn.set_pixel(x, y, r, g, b)
+
+    def show(self):
+        unicorn.show()
+
+    def close(self):
+        pass
+
+class VirtualMatrix:
+    """In-memory stand-in for the Unicorn HAT.
+
+    Every show() is recorded as a timestamped frame so the server and its
+    animations can be run and benchmarked without hardware. Frames can also
+    be streamed to a capture file: a CAPTURE_MAGIC header with the matrix
+    size, then one record per frame of a little-endian uint64 microsecond
+    offset followed by width * height RGB bytes.
+    """
+
+    name = "Virtual"
+    CAPTURE_MAGIC = b"UHCAP1"
+    MAX_FRAMES = 1000  # Frames kept in memory for inspection
+
+    def __init__(self, width=8, height=8, capture_path=None):
+        self.width = width
+        self.height = height
+        self.level = 1.0
+        self.pixels = bytearray(width * height * 3)
+        self.frames = deque(maxlen=self.MAX_FRAMES)
+        self.frame_count = 0
+        self.started = time.monotonic()
+        self.first_frame = None
+        self.last_frame = None
+        self.max_interval = 0.0
+        self.capture = None
+        if capture_path:
+            self.capture = open(capture_path, 'wb')
+            self.capture.write(self.CAPTURE_MAGIC + struct.pack('<BB', width, height))
+
+    def brightness(self, level):
+        self.level = level
+
+    def set_pixel(self, x, y, r, g, b):
+        i = (y * self.width + x) * 3
+        self.pixels[i:i + 3] = bytes((r, g, b))
+
+    def show(self):
+        now = time.monotonic()
+        frame = bytes(self.pixels)
+        self.frames.append((now, frame))
+        self.frame_count += 1
+        if self.first_frame is None:
+            self.first_frame = now
+        elif now - self.last_frame > self.max_interval:
+            self.max_interval = now - self.last_frame
+        self.last_frame = now
+        if self.capture:
+            offset_us = int((now - self.started) * 1000000)
+            self.capture.write(struct.pack('<Q', offset_us) + frame)
+
+    def stats(self):
+        """Frame statistics since start"""
+        span = (self.last_frame - self.first_frame) if self.frame_count > 1 else 0.0
+        return {
+            'frames': self.frame_count,
+            'span_seconds': round(span, 3),
+            'fps': round((self.frame_count - 1) / span, 2) if span > 0 else 0.0,
+            'max_interval_ms': round(self.max_interval * 1000, 3)
+        }
+
+    def close(self):
+        if self.capture:
+            self.capture.close()
+            self.capture = None
+
+def load_capture(path):
+    """Read a VirtualMatrix capture file into (width, height, [(seconds, rgb_bytes)])"""
+    with open(path, 'rb') as f:
+        header = f.read(len(VirtualMatrix.CAPTURE_MAGIC) + 2)
+        if header[:-2] != VirtualMatrix.CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a display capture file")
+        width, height = struct.unpack('<BB', header[-2:])
+        size = width * height * 3
+        frames = []
+        while True:
+            record = f.read(8 + size)
+            if len(record) < 8 + size:
+                break
+            offset_us, = struct.unpack('<Q', record[:8])
+            frames.append((offset_us / 1000000, record[8:]))
+    return width, height, frames
+
+def create_display_backend():
+    """Pick the display backend from config (auto falls back to virtual)"""
+    backend = SETTINGS.display_backend
+    if backend == 'unicornhat' or (backend == 'auto' and unicorn is not None):
+        if unicorn is None:
+            print("Error: 'unicornhat' module not found. Install with: curl -sS https://get.pimoroni.com/unicornhat | bash")
+            sys.exit(1)
+        return UnicornHatBackend()
+    return VirtualMatrix(capture_path=SETTINGS.capture_file)
 
 # ============================================================================
 # UNICORN HAT FUNCTIONS
 # ============================================================================
 
-def signal_handler(sig, frame):
-    """Handle Ctrl+C gracefully"""
-    global shutdown_flag, httpd
-    print("\n\n  Shutting down...")
-    shutdown_flag = True
-    if mqtt_client:
-        mqtt_client.disconnect()
-    if httpd:
-        httpd.shutdown()
-    clear_display()
-    sys.exit(0)
+class Display:
+    """Virtual framebuffer in front of the LED matrix.
+
+    Animations draw into the buffer; show() compares it with the last frame
+    pushed to the hardware and only writes the pixels that changed. When
+    nothing changed the hardware show() (the SPI/PWM write) is skipped.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.width = backend.width
+        self.height = backend.height
+        self.buffer = [(0, 0, 0)] * (self.width * self.height)
+        self.shown = None  # Last frame written to the hardware
+        self.writes = 0
+        self.skipped = 0
+
+    def set_pixel(self, x, y, r, g, b):
+        self.buffer[y * self.width + x] = (r, g, b)
+
+    def fill(self, color):
+        self.buffer = [tuple(color)] * (self.width * self.height)
+
+    def clear(self):
+        self.fill((0, 0, 0))
+
+    def load(self, frame):
+        """Replace the buffer with a precomputed frame"""
+        self.buffer = list(frame)
+
+    def brightness(self, level):
+        self.backend.brightness(level)
+        self.shown = None  # Force the next frame out at the new brightness
+
+    def show(self):
+        """Push the buffer to the hardware; returns False if it was unchanged"""
+        frame = self.buffer
+        shown = self.shown
+        if frame == shown:
+            self.skipped += 1
+            return False
+        width = self.width
+        for i, pixel in enumerate(frame):
+            if shown is None or shown[i] != pixel:
+                self.backend.set_pixel(i % width, i // width, *pixel)
+        self.backend.show()
+        self.shown = list(frame)
+        self.writes += 1
+        return True
+
+    def snapshot(self):
+        stats = {'backend': self.backend.name, 'writes': self.writes, 'skipped': self.skipped}
+        if hasattr(self.backend, 'stats'):
+            stats['frames'] = self.backend.stats()
+        return stats
+
+display = None
 
 def setup_unicorn():
-    """Initialize Unicorn HAT"""
-    unicorn.set_layout(unicorn.HAT)
-    unicorn.rotation(0)
-    unicorn.brightness(CONFIG['unicorn']['brightness'])
+    """Initialize the display backend (Unicorn HAT or virtual matrix)"""
+    global display
+    display = Display(create_display_backend())
+    display.brightness(SETTINGS.brightness)
 
 def clear_display():
     """Clear all LEDs"""
-    unicorn.clear()
-    unicorn.show()
+    display.clear()
+    display.show()
 
 def set_solid_color(color):
     """Fill entire matrix with solid color"""
-    r, g, b = color
-    for x in range(8):
-        for y in range(8):
-            unicorn.set_pixel(x, y, r, g, b)
-    unicorn.show()
+    display.fill(color)
+    display.show()
+
+class FrameScheduler:
+    """Fixed-timestep frame pacing against absolute monotonic deadlines.
+
+    Frame N of an animation is due at start + N * interval. Rendering time is
+    absorbed by sleeping only until the next deadline, and frames whose slot
+    has already passed are skipped so the configured duration is kept.
+
+    Waits between frames happen on status_event, so a status change preempts
+    the running animation within one frame interval.
+    """
+
+    WINDOW = 256  # Frames kept for render-time/jitter statistics
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frames_rendered = 0
+        self.frames_dropped = 0
+        self.frames_preempted = 0
+        self.render_times = deque(maxlen=self.WINDOW)
+        self.jitters = deque(maxlen=self.WINDOW)
+        self.status_latencies = deque(maxlen=self.WINDOW)
+        # Receive time (and trace) of a status change whose first frame is not
+        # shown yet. Only touched from the animation thread.
+        self.latency_start = None
+        self.latency_trace = None
+
+    def frame_shown(self):
+        """Record POST-to-pixel latency for the first frame after a change"""
+        if self.latency_start is None:
+            return
+        latency = time.monotonic() - self.latency_start
+        self.latency_start = None
+        metrics.status_to_pixel_seconds.observe(latency)
+        tracer.mark(self.latency_trace, 'first_frame')
+        self.latency_trace = None
+        with self.lock:
+            self.status_latencies.append(latency)
+
+    def wait(self, timeout=None):
+        """Sleep up to timeout seconds (None = until the next status change).
+
+        Returns True if a status change woke us.
+        """
+        if timeout is not None and timeout <= 0:
+            return status_event.is_set()
+        return status_event.wait(timeout)
+
+    def run(self, steps, duration, render_frame):
+        """Render steps frames spread over duration seconds.
+
+        Returns False if the animation was preempted by a status change.
+        """
+        interval = duration / steps
+        stride = power.sample()  # Render every stride-th frame when hot or busy
+        start = time.monotonic()
+        step = 0
+        while step < steps and not shutdown_flag:
+            if status_event.is_set():
+                with self.lock:
+                    self.frames_preempted += 1
+                return False
+            deadline = start + step * interval
+            frame_start = time.monotonic()
+            render_frame(step)
+            frame_end = time.monotonic()
+            self.frame_shown()
+            metrics.frame_render_seconds.observe(frame_end - frame_start)
+
+            with self.lock:
+                self.frames_rendered += 1
+                self.render_times.append(frame_end - frame_start)
+                self.jitters.append(max(0.0, frame_start - deadline))
+
+            # Next frame whose deadline is still ahead; anything in between is dropped
+            next_step = step + stride
+            late_step = int((frame_end - start) / interval)
+            if late_step > next_step:
+                with self.lock:
+                    self.frames_dropped += min(late_step, steps) - next_step
+                next_step = late_step
+            if next_step >= steps:
+                # Sleep out the remainder of the last slot so durations stay exact
+                self.wait(start + duration - time.monotonic())
+                break
+            self.wait(start + next_step * interval - time.monotonic())
+            step = next_step
+        return True
+
+    def snapshot(self):
+        """Frame-timing metrics (times in milliseconds)"""
+        with self.lock:
+            render_times = list(self.render_times)
+            jitters = list(self.jitters)
+            status_latencies = list(self.status_latencies)
+            rendered = self.frames_rendered
+            dropped = self.frames_dropped
+            preempted = self.frames_preempted
+
+        def summary(values):
+            if not values:
+                return {'avg_ms': 0.0, 'max_ms': 0.0}
+            return {
+                'avg_ms': round(sum(values) / len(values) * 1000, 3),
+                'max_ms': round(max(values) * 1000, 3)
+            }
+
+        return {
+            'frames_rendered': rendered,
+            'frames_dropped': dropped,
+            'animations_preempted': preempted,
+            'render_time': summary(render_times),
+            'jitter': summary(jitters),
+            'status_latency': summary(status_latencies),
+            'display': display.snapshot(),
+            'power': power.snapshot()
+        }
+
+frame_scheduler = FrameScheduler()
+
+THERMAL_ZONE = '/sys/class/thermal/thermal_zone0/temp'
+POWER_SAMPLE_INTERVAL = 5.0  # Seconds between CPU/temperature samples
+
+class PowerGovernor:
+    """Frame-rate stride from measured CPU use and SoC temperature.
+
+    Sampled at most every POWER_SAMPLE_INTERVAL seconds. While the process
+    uses more than unicorn.max_cpu percent CPU or the SoC is hotter than
+    unicorn.max_temperature, each sample doubles the stride (animations
+    render every 2nd, then every 4th frame); once both are back below 90% of
+    their limits it halves again.
+    """
+
+    MAX_STRIDE = 4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stride = 1
+        self.cpu_percent = 0.0  # Over the last sample interval
+        self.temperature = None
+        self.idle = False  # Holding a static frame (unicorn.idle_timeout)
+        self.sampled = time.monotonic()
+        self.cpu_seconds = process_cpu_seconds()
+
+    def sample(self):
+        """Take a sample if one is due; returns the current stride"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.sampled < POWER_SAMPLE_INTERVAL:
+                return self.stride
+            cpu_seconds = process_cpu_seconds()
+            self.cpu_percent = (cpu_seconds - self.cpu_seconds) / (now - self.sampled) * 100
+            self.sampled, self.cpu_seconds = now, cpu_seconds
+            self.temperature = soc_temperature()
+
+            settings = SETTINGS
+            temperature = self.temperature or 0.0
+            if self.cpu_percent > settings.max_cpu or temperature > settings.max_temperature:
+                self.stride = min(self.stride * 2, self.MAX_STRIDE)
+            elif self.cpu_percent < settings.max_cpu * 0.9 and temperature < settings.max_temperature * 0.9:
+                self.stride = max(self.stride // 2, 1)
+            return self.stride
+
+    def snapshot(self):
+        self.sample()
+        return {
+            'frame_stride': self.stride,
+            'idle': self.idle,
+            'cpu_percent': round(self.cpu_percent, 1),
+            'temperature_c': self.temperature
+        }
+
+def process_cpu_seconds():
+    cpu = os.times()
+    return cpu.user + cpu.system
+
+def soc_temperature():
+    """SoC temperature in degrees C (None where unavailable)"""
+    try:
+        with open(THERMAL_ZONE) as f:
+            return int(f.read()) / 1000
+    except (OSError, ValueError):
+        return None
+
+power = PowerGovernor()
 
 def pulse_animation(color, duration=2.0, steps=50):
     """Pulse animation"""
     r, g, b = color
-    for i in range(steps):
-        if shutdown_flag:
-            break
+
+    def render(i):
         brightness = (math.sin(i * math.pi * 2 / steps) + 1) / 2
         scaled_r = int(r * brightness)
         scaled_g = int(g * brightness)
         scaled_b = int(b * brightness)
         for x in range(8):
             for y in range(8):
-                unicorn.set_pixel(x, y, scaled_r, scaled_g, scaled_b)
-        unicorn.show()
-        time.sleep(duration / steps)
+                display.set_pixel(x, y, scaled_r, scaled_g, scaled_b)
+        display.show()
+
+    return frame_scheduler.run(steps, duration, render)
 
 def gradient_animation(color):
     """Vertical gradient"""
@@ -182,8 +1606,8 @@ def gradient_animation(color):
         scaled_g = int(g * intensity)
         scaled_b = int(b * intensity)
         for x in range(8):
-            unicorn.set_pixel(x, y, scaled_r, scaled_g, scaled_b)
-    unicorn.show()
+            display.set_pixel(x, y, scaled_r, scaled_g, scaled_b)
+    display.show()
 
 def ripple_animation(color, duration=1.0):
     """Ripple effect"""
@@ -191,86 +1615,424 @@ def ripple_animation(color, duration=1.0):
     center_x, center_y = 3.5, 3.5
     max_distance = math.sqrt(center_x**2 + center_y**2)
     steps = 20
-    for step in range(steps):
-        if shutdown_flag:
-            break
+
+    def render(step):
+        wave_position = (step / steps) * max_distance
         for x in range(8):
             for y in range(8):
                 distance = math.sqrt((x - center_x)**2 + (y - center_y)**2)
-                wave_position = (step / steps) * max_distance
                 intensity = 1.0 - abs(distance - wave_position) / max_distance
                 intensity = max(0, min(1, intensity))
                 scaled_r = int(r * intensity)
                 scaled_g = int(g * intensity)
                 scaled_b = int(b * intensity)
-                unicorn.set_pixel(x, y, scaled_r, scaled_g, scaled_b)
-        unicorn.show()
-        time.sleep(duration / steps)
+                display.set_pixel(x, y, scaled_r, scaled_g, scaled_b)
+        display.show()
+
+    return frame_scheduler.run(steps, duration, render)
 
 def spinner_animation(color, duration=1.0):
     """Spinning line"""
     r, g, b = color
     center_x, center_y = 3.5, 3.5
     steps = 24
-    for step in range(steps):
-        if shutdown_flag:
-            break
-        unicorn.clear()
+
+    def render(step):
+        display.clear()
         angle = (step / steps) * 2 * math.pi
         for radius in range(5):
             x = int(center_x + radius * math.cos(angle))
             y = int(center_y + radius * math.sin(angle))
             if 0 <= x < 8 and 0 <= y < 8:
                 intensity = 1.0 - (radius / 5)
-                unicorn.set_pixel(x, y, int(r * intensity), int(g * intensity), int(b * intensity))
-        unicorn.show()
-        time.sleep(duration / steps)
+                display.set_pixel(x, y, int(r * intensity), int(g * intensity), int(b * intensity))
+        display.show()
+
+    return frame_scheduler.run(steps, duration, render)
+
+def play_animation(program, color):
+    """One loop of a compiled custom animation; static ones draw once and idle"""
+    frames = program.frames
+    if len(frames[0]) != display.width * display.height:
+        set_solid_color(color)  # Compiled for ANIMATION_MATRIX; other matrix sizes get the plain color
+        frames = None
+    elif len(frames) == 1:
+        display.load(frames[0])
+        display.show()
+    if frames is None or len(frames) == 1:
+        frame_scheduler.frame_shown()
+        frame_scheduler.wait()
+        return True
+
+    def render(i):
+        display.load(frames[i])
+        display.show()
+
+    return frame_scheduler.run(len(frames), program.duration, render)
+
+def crossfade_transition(from_color, to_color, duration, steps=10):
+    """Blend the whole matrix from one color to another"""
+    def render(step):
+        t = (step + 1) / steps
+        set_solid_color(tuple(int(a + (b - a) * t) for a, b in zip(from_color, to_color)))
+
+    return frame_scheduler.run(steps, duration, render)
+
+def board_layout(count, width, height):
+    """Tile rectangles (x, y, w, h) for count users on a width x height matrix.
+
+    Users are laid out on the most square grid that fits. Cell edges are
+    spread over the whole matrix, so the last row and column reach its edge
+    even when the size does not divide evenly; tiles of 3px or more keep a
+    1px gap to their right and lower neighbours so they stay distinguishable.
+    With more users than tiles of at least 1px, each user gets a single pixel
+    in reading order.
+    """
+    if count == 0:
+        return []
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    if width // cols == 0 or height // rows == 0:
+        return [(i % width, i // width, 1, 1) for i in range(min(count, width * height))]
+    gap = 1 if width // cols >= 3 and height // rows >= 3 else 0
+    xs = [c * width // cols for c in range(cols + 1)]
+    ys = [r * height // rows for r in range(rows + 1)]
+    tiles = []
+    for i in range(count):
+        c, r = i % cols, i // cols
+        tiles.append((xs[c], ys[r],
+                      xs[c + 1] - xs[c] - (gap if c < cols - 1 else 0),
+                      ys[r + 1] - ys[r] - (gap if r < rows - 1 else 0)))
+    return tiles
+
+_layout_cache = {}
+
+def render_board():
+    """Compose every user's tile into one frame and show it"""
+    version, colors = renderer_board or presence.colors()
+    key = (len(colors), display.width, display.height)
+    layout = _layout_cache.get(key)
+    if layout is None:
+        layout = _layout_cache[key] = board_layout(*key)
+    display.clear()
+    for (x0, y0, w, h), (r, g, b) in zip(layout, colors):
+        for x in range(x0, x0 + w):
+            for y in range(y0, y0 + h):
+                display.set_pixel(x, y, r, g, b)
+    display.show()
 
 def animation_loop():
     """Background animation thread"""
+    shown_color = None
+    last_change_seen = None
+    last_change_at = time.monotonic()
+    brightness = SETTINGS.brightness
     while not shutdown_flag:
+        status_event.clear()
+        settings = SETTINGS
         status = current_status['availability']
         color = STATUS_COLORS.get(status, STATUS_COLORS["Unknown"])
-        animation_mode = CONFIG['unicorn']['animation_mode']
+        animation_mode = settings.animation_mode
+        if settings.brightness != brightness:
+            brightness = settings.brightness
+            display.brightness(brightness)
+
+        change = status_change
+        if change is not last_change_seen:
+            last_change_seen = change
+            last_change_at = change[0]
+            frame_scheduler.latency_start, frame_scheduler.latency_trace = change
+
+        # Team board: one composed frame per change, idle in between
+        if animation_mode == "board":
+            render_board()
+            frame_scheduler.frame_shown()
+            shown_color = None
+            frame_scheduler.wait()
+            continue
+
+        transition = settings.transition_duration
+        if shown_color is not None and shown_color != color and transition > 0:
+            if not crossfade_transition(shown_color, color, transition):
+                continue
+        shown_color = color
 
+        # Nobody has changed status for a while: hold a static frame until the next change
+        idle_timeout = settings.idle_timeout
+        moving = animation_mode in MOVING_MODES or animation_mode in settings.animations
+        if idle_timeout and moving and time.monotonic() - last_change_at > idle_timeout:
+            power.idle = True
+            set_solid_color(color)
+            frame_scheduler.frame_shown()
+            frame_scheduler.wait()
+            power.idle = False
+            continue
+
+        # Static modes draw once and idle until the next status change
         if animation_mode == "solid":
             set_solid_color(color)
-            time.sleep(0.1)
+            frame_scheduler.frame_shown()
+            frame_scheduler.wait()
         elif animation_mode == "pulse":
             pulse_animation(color, duration=2.0)
         elif animation_mode == "gradient":
             gradient_animation(color)
-            time.sleep(0.5)
+            frame_scheduler.frame_shown()
+            frame_scheduler.wait()
         elif animation_mode == "ripple":
             ripple_animation(color, duration=1.5)
         elif animation_mode == "spinner":
             spinner_animation(color, duration=1.5)
+        elif animation_mode in settings.animations:
+            play_animation(settings.animations[animation_mode].program(status), color)
         else:
             set_solid_color(color)
-            time.sleep(0.1)
+            frame_scheduler.frame_shown()
+            frame_scheduler.wait()
 
 def startup_animation():
-    """Rainbow startup"""
-    for hue in range(360):
-        if shutdown_flag:
-            break
+    """Rainbow startup, cut short as soon as the first status arrives"""
+    def render(hue):
         r, g, b = [int(c * 255) for c in hsv_to_rgb(hue / 360.0, 1.0, 1.0)]
         set_solid_color((r, g, b))
-        time.sleep(0.005)
+
+    if frame_scheduler.run(360, 1.8, render):
+        clear_display()
+        frame_scheduler.wait(0.5)
+
+def display_thread():
+    """Play the startup animation, then run the status animations"""
+    startup_animation()
+    animation_loop()
+
+def animation_snapshot():
+    """Frame metrics from whichever process renders the LEDs (None before the display is up)"""
+    if renderer:
+        return renderer.stats or None
+    return frame_scheduler.snapshot() if display else None
+
+def current_frame():
+    """(width, height, RGB bytes) of the frame on the LEDs, or None"""
+    if renderer:
+        return renderer.frame.read()
+    shown = display.shown if display else None
+    if shown is None:
+        return None
+    return display.width, display.height, bytes(c for pixel in shown for c in pixel)
+
+# ============================================================================
+# RENDERER PROCESS (unicorn.renderer: process)
+# ============================================================================
+
+FRAME_HEADER = struct.Struct('<QHH')  # Sequence (odd while a write is in progress), width, height
+MAX_FRAME_PIXELS = 32 * 32
+RENDERER_STATS_INTERVAL = 1.0  # Seconds between frame statistics sent by the renderer
+RENDERER_TRACES = 64  # Status changes waiting for their first frame
+
+class SharedFrame:
+    """The frame on the LEDs, in multiprocessing shared memory.
+
+    Only the renderer writes. Readers take no lock: the sequence number is
+    odd while a write is in progress, so a torn read is retried.
+    """
+
+    def __init__(self):
+        from multiprocessing import shared_memory
+        self.shm = shared_memory.SharedMemory(create=True, size=FRAME_HEADER.size + MAX_FRAME_PIXELS * 3)
+        self.seq = 0
+
+    def write(self, width, height, pixels):
+        buf = self.shm.buf
+        FRAME_HEADER.pack_into(buf, 0, self.seq + 1, width, height)
+        buf[FRAME_HEADER.size:FRAME_HEADER.size + len(pixels)] = pixels
+        self.seq += 2
+        FRAME_HEADER.pack_into(buf, 0, self.seq, width, height)
+
+    def read(self):
+        buf = self.shm.buf
+        for _ in range(3):
+            seq, width, height = FRAME_HEADER.unpack_from(buf, 0)
+            if seq == 0:
+                return None  # Nothing shown yet
+            if seq % 2:
+                continue
+            pixels = bytes(buf[FRAME_HEADER.size:FRAME_HEADER.size + width * height * 3])
+            if FRAME_HEADER.unpack_from(buf, 0)[0] == seq:
+                return width, height, pixels
+        return None
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+class SharedFrameBackend:
+    """Display backend wrapper that mirrors every shown frame into a SharedFrame"""
+
+    def __init__(self, backend, frame):
+        if backend.width * backend.height > MAX_FRAME_PIXELS:
+            raise ValueError(f"matrix larger than {MAX_FRAME_PIXELS} pixels")
+        self.backend = backend
+        self.frame = frame
+        self.pixels = bytearray(backend.width * backend.height * 3)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+    def set_pixel(self, x, y, r, g, b):
+        i = (y * self.backend.width + x) * 3
+        self.pixels[i:i + 3] = bytes((r, g, b))
+        self.backend.set_pixel(x, y, r, g, b)
+
+    def show(self):
+        self.backend.show()
+        self.frame.write(self.backend.width, self.backend.height, self.pixels)
+
+class RendererProcess:
+    """The LED renderer in a child process, on its own core and GIL.
+
+    The child is forked before any other thread starts and runs the usual
+    display thread on its copy of the module state. The server forwards
+    state over a pipe whenever status_event fires; the child sends back
+    frame statistics (including its render and status-to-pixel histograms)
+    and first-frame trace marks, and mirrors each shown frame into a
+    SharedFrame.
+    """
+
+    def __init__(self):
+        context = multiprocessing.get_context('fork')
+        self.frame = SharedFrame()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=renderer_main, args=(child_conn, self.frame), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.send_lock = threading.Lock()
+        self.stats = {}
+        self.traces = {}  # Change number -> Trace waiting for its first frame
+        threading.Thread(target=self.forward, daemon=True).start()
+        threading.Thread(target=self.receive, daemon=True).start()
+
+    def send(self, message):
+        try:
+            with self.send_lock:
+                self.conn.send(message)
+        except OSError:
+            pass  # Renderer gone; shutdown() reports nothing else to do
+
+    def forward(self):
+        """Send status, settings and board colors to the renderer on every status_event"""
+        sent_settings = None
+        seen_change = None
+        changes = 0
+        while True:
+            status_event.wait()
+            status_event.clear()
+            if shutdown_flag:
+                return
+            settings = SETTINGS
+            message = {'availability': current_status['availability']}
+            if settings is not sent_settings:
+                sent_settings = message['settings'] = settings
+            change = status_change
+            if change is not seen_change:
+                seen_change = change
+                changes += 1
+                message['change'] = (change[0], changes)
+                if change[1] is not None:
+                    if len(self.traces) >= RENDERER_TRACES:
+                        del self.traces[next(iter(self.traces))]
+                    self.traces[changes] = change[1]
+            if settings.animation_mode == 'board':
+                message['board'] = presence.colors()
+            self.send(('state', message))
+
+    def receive(self):
+        while True:
+            try:
+                kind, payload = self.conn.recv()
+            except (EOFError, OSError):
+                return
+            if kind == 'stats':
+                self.stats, metrics.frame_render_seconds, metrics.status_to_pixel_seconds = payload
+            elif kind == 'first_frame':
+                tracer.mark(self.traces.pop(payload, None), 'first_frame')
+
+    def stop(self, deadline):
+        """Ask the renderer to blank the LEDs and exit; killed at deadline"""
+        self.send(('stop', None))
+        self.process.join(max(0, deadline - time.monotonic()))
+        if self.process.is_alive():
+            self.process.kill()
+        self.frame.close()
+
+class RendererLink:
+    """Renderer side of the pipe; stands in for the tracer in the child"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        try:
+            with self.lock:
+                self.conn.send(message)
+        except OSError:
+            pass
+
+    def mark(self, trace, stage, ok=True):
+        if trace is not None:
+            self.send(('first_frame', trace))
+
+def renderer_main(conn, frame):
+    """Entry point of the renderer process"""
+    global tracer
+    # The server coordinates shutdown; it stops us over the pipe
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    httpd.server_close()
+    if udp_sock:
+        udp_sock.close()
+
+    link = tracer = RendererLink(conn)
+    setup_unicorn()
+    display.backend = SharedFrameBackend(display.backend, frame)
+    threading.Thread(target=renderer_commands, args=(conn,), daemon=True).start()
+    threading.Thread(target=renderer_stats, args=(link,), daemon=True).start()
+    display_thread()
     clear_display()
-    time.sleep(0.5)
+    display.backend.close()
+
+def renderer_commands(conn):
+    """Apply state from the server; stop when told to or when the server is gone"""
+    global SETTINGS, status_change, renderer_board, shutdown_flag
+    while True:
+        try:
+            kind, message = conn.recv()
+        except (EOFError, OSError):
+            kind = 'stop'
+        if kind == 'stop':
+            shutdown_flag = True
+            status_event.set()
+            return
+        current_status['availability'] = message['availability']
+        if 'settings' in message:
+            SETTINGS = message['settings']
+        if 'change' in message:
+            status_change = message['change']  # (received, change number); the number comes back in 'first_frame'
+        renderer_board = message.get('board')
+        status_event.set()
+
+def renderer_stats(link):
+    while not shutdown_flag:
+        time.sleep(RENDERER_STATS_INTERVAL)
+        link.send(('stats', (frame_scheduler.snapshot(), metrics.frame_render_seconds, metrics.status_to_pixel_seconds)))
 
 # ============================================================================
 # WEB DASHBOARD (same as before)
 # ============================================================================
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <title>Teams Presence</title>
-    <style>
+# The dashboard is a static shell: live values are filled in from /api/status.
+# CSS and JS are served under content-hashed names so browsers can keep them.
+DASHBOARD_CSS = """
         * { margin: 0; padding: 0; box-sizing: border-box; }
         body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Arial, sans-serif;
@@ -306,8 +2068,15 @@ HTML_TEMPLATE = """
         .stats-grid { display: grid; grid-template-columns: 1fr 1fr; gap: 15px; margin-top: 20px; }
         .stat-item { text-align: center; padding: 20px; background: rgba(255, 255, 255, 0.1); border-radius: 12px; }
         .stat-value { font-size: 28px; font-weight: bold; margin-bottom: 5px; }
-    </style>
-    <script>
+        .team-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(120px, 1fr)); gap: 10px; }
+        .team-tile { padding: 12px; border-radius: 12px; text-align: center; background: rgba(255, 255, 255, 0.1); }
+        .team-name { font-weight: bold; margin-bottom: 4px; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; }
+        .team-status { font-size: 13px; opacity: 0.9; }
+        .timeline-label { font-size: 12px; opacity: 0.8; margin: 12px 0 4px; }
+        .timeline { width: 100%; height: 24px; border-radius: 6px; background: rgba(255, 255, 255, 0.1); display: block; }
+"""
+
+DASHBOARD_JS = """
         function updateStatus() {
             fetch('/api/status')
                 .then(r => r.json())
@@ -316,57 +2085,242 @@ HTML_TEMPLATE = """
                     document.getElementById('status-text').textContent = data.availability;
                     document.getElementById('status-card').className = 'status-display ' + data.availability.toLowerCase().replace(' ', '');
                     document.getElementById('uptime').textContent = data.uptime;
+                    document.getElementById('changes').textContent = data.changes;
                 });
         }
+        function updateTeam() {
+            fetch('/api/users')
+                .then(r => r.json())
+                .then(users => {
+                    const card = document.getElementById('team-card');
+                    card.style.display = users.length > 1 ? 'block' : 'none';
+                    const grid = document.getElementById('team-grid');
+                    grid.replaceChildren(...users.map(u => {
+                        const tile = document.createElement('div');
+                        tile.className = 'team-tile ' + u.availability.toLowerCase();
+                        const name = document.createElement('div');
+                        name.className = 'team-name';
+                        name.textContent = u.user_id;
+                        const status = document.createElement('div');
+                        status.className = 'team-status';
+                        status.textContent = u.emoji + ' ' + u.availability;
+                        tile.append(name, status);
+                        return tile;
+                    }));
+                });
+        }
+        function updateTimeline() {
+            document.querySelectorAll('img.timeline').forEach(img => {
+                img.src = '/api/timeline/sparkline.svg?resolution=' + img.dataset.resolution + '&t=' + Date.now();
+            });
+        }
         setInterval(updateStatus, 3000);
-        updateStatus();
-    </script>
+        setInterval(updateTeam, 3000);
+        setInterval(updateTimeline, 60000);
+        window.addEventListener('DOMContentLoaded', () => { updateStatus(); updateTeam(); });
+"""
+
+DASHBOARD_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>Teams Presence</title>
+    <link rel="stylesheet" href="{css}">
+    <script src="{js}"></script>
 </head>
 <body>
     <div class="container">
         <div class="card">
             <h1>Teams Presence</h1>
-            <div id="status-card" class="status-display {{ status_class }}">
-                <div id="status-emoji" class="status-emoji">{{ emoji }}</div>
-                <div id="status-text" class="status-text">{{ status }}</div>
+            <div id="status-card" class="status-display">
+                <div id="status-emoji" class="status-emoji">&nbsp;</div>
+                <div id="status-text" class="status-text">&nbsp;</div>
             </div>
             <div class="stats-grid">
                 <div class="stat-item">
-                    <div id="uptime" class="stat-value">{{ uptime }}</div>
+                    <div id="uptime" class="stat-value">-</div>
                     <div style="font-size: 12px; opacity: 0.8;">UPTIME</div>
                 </div>
                 <div class="stat-item">
-                    <div class="stat-value">{{ changes }}</div>
+                    <div id="changes" class="stat-value">-</div>
                     <div style="font-size: 12px; opacity: 0.8;">CHANGES</div>
                 </div>
             </div>
         </div>
+        <div class="card">
+            <h1>Timeline</h1>
+            <div class="timeline-label">LAST 24 HOURS</div>
+            <img class="timeline" data-resolution="1m" src="/api/timeline/sparkline.svg?resolution=1m" alt="">
+            <div class="timeline-label">LAST 7 DAYS</div>
+            <img class="timeline" data-resolution="15m" src="/api/timeline/sparkline.svg?resolution=15m" alt="">
+            <div class="timeline-label">LAST 31 DAYS</div>
+            <img class="timeline" data-resolution="1h" src="/api/timeline/sparkline.svg?resolution=1h" alt="">
+        </div>
+        <div id="team-card" class="card" style="display: none;">
+            <h1>Team</h1>
+            <div id="team-grid" class="team-grid"></div>
+        </div>
     </div>
 </body>
 </html>
 """
 
-@app.route('/')
-def index():
-    status = current_status['availability']
-    return render_template_string(
-        HTML_TEMPLATE,
-        status=status,
-        status_class=status.lower().replace(' ', ''),
-        emoji=STATUS_EMOJI.get(status, '[??]'),
-        uptime=format_uptime(current_status['uptime_seconds']),
-        changes=len(status_history)
-    )
+STATIC_MAX_AGE = 365 * 86400
+
+def static_asset(body, content_type, cache_control):
+    """Response bytes for a fixed asset, plain and gzipped, computed once"""
+    raw = body.encode('utf-8')
+    return {
+        'content_type': content_type,
+        'raw': raw,
+        'gzip': gzip.compress(raw, 9, mtime=0),
+        'etag': '"' + hashlib.sha256(raw).hexdigest()[:16] + '"',
+        'cache_control': cache_control,
+    }
+
+def build_dashboard_assets():
+    """URL path -> static asset for the dashboard shell, CSS and JS.
+
+    CSS and JS get a content hash in their name and a year-long immutable
+    Cache-Control. The HTML shell keeps its URL, so it is revalidated by ETag
+    (a 304 with no body once the browser has it).
+    """
+    immutable = f'public, max-age={STATIC_MAX_AGE}, immutable'
+    css = static_asset(DASHBOARD_CSS, 'text/css; charset=utf-8', immutable)
+    js = static_asset(DASHBOARD_JS, 'application/javascript; charset=utf-8', immutable)
+    css_path = '/assets/dashboard.' + css['etag'].strip('"') + '.css'
+    js_path = '/assets/dashboard.' + js['etag'].strip('"') + '.js'
+    html = DASHBOARD_HTML.replace('{css}', css_path).replace('{js}', js_path)
+    return {
+        '/': static_asset(html, 'text/html; charset=utf-8', 'no-cache'),
+        css_path: css,
+        js_path: js,
+    }
+
+def create_web_app():
+    """Build the dashboard app; Flask is only imported when the dashboard is enabled"""
+    from flask import Flask, Response, jsonify, request
+    from flask_cors import CORS
+
+    app = Flask(__name__, static_folder=None)
+    CORS(app)
+    assets = build_dashboard_assets()
 
-@app.route('/api/status')
-def api_status():
-    return jsonify({
-        'availability': current_status['availability'],
-        'timestamp': current_status['timestamp'],
-        'uptime': format_uptime(current_status['uptime_seconds']),
-        'emoji': STATUS_EMOJI.get(current_status['availability'], '[??]'),
-        'color': rgb_to_hex(STATUS_COLORS.get(current_status['availability'], (255, 255, 255)))
-    })
+    def send_asset(asset):
+        headers = {'ETag': asset['etag'], 'Cache-Control': asset['cache_control'], 'Vary': 'Accept-Encoding'}
+        if request.headers.get('If-None-Match') == asset['etag']:
+            return Response(status=304, headers=headers)
+        body = asset['raw']
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            body = asset['gzip']
+            headers['Content-Encoding'] = 'gzip'
+        return Response(body, content_type=asset['content_type'], headers=headers)
+
+    @app.route('/')
+    def index():
+        return send_asset(assets['/'])
+
+    @app.route('/assets/<name>')
+    def static_file(name):
+        asset = assets.get('/assets/' + name)
+        if asset is None:
+            return jsonify({'error': 'not found'}), 404
+        return send_asset(asset)
+
+    status_cache = {}  # 'body': (key, serialized /api/status), rebuilt when the status changes
+
+    @app.route('/api/status')
+    def api_status():
+        uptime = format_uptime(current_status['uptime_seconds'])
+        key = (current_status['availability'], current_status['timestamp'], len(status_history), uptime)
+        cached = status_cache.get('body')
+        if cached is None or cached[0] != key:
+            availability = key[0]
+            cached = status_cache['body'] = (key, json.dumps({
+                'availability': availability,
+                'timestamp': key[1],
+                'uptime': uptime,
+                'changes': key[2],
+                'emoji': STATUS_EMOJI.get(availability, '[??]'),
+                'color': rgb_to_hex(STATUS_COLORS.get(availability, (255, 255, 255)))
+            }).encode('utf-8'))
+        return Response(cached[1], content_type='application/json', headers={'Cache-Control': 'no-cache'})
+
+    @app.route('/api/history')
+    def api_history():
+        try:
+            limit = int(request.args.get('limit', HISTORY_API_ROWS))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        return jsonify(history_with_durations(min(max(limit, 1), MAX_HISTORY)))
+
+    @app.route('/api/timeline')
+    def api_timeline():
+        resolution = request.args.get('resolution', '15m')
+        if resolution not in TIMELINE_RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of: {', '.join(TIMELINE_RESOLUTIONS)}"}), 400
+        return jsonify({
+            'resolution': resolution,
+            'bucket_seconds': TIMELINE_RESOLUTIONS[resolution][0],
+            'buckets': [{'start': datetime.fromtimestamp(bucket).isoformat(),
+                         'seconds': {status: round(v) for status, v in seconds.items() if v > 0.5}}
+                        for bucket, seconds in timeline.query(resolution)]
+        })
+
+    @app.route('/api/timeline/sparkline.svg')
+    def api_timeline_sparkline():
+        resolution = request.args.get('resolution', '15m')
+        if resolution not in TIMELINE_RESOLUTIONS:
+            return jsonify({'error': f"resolution must be one of: {', '.join(TIMELINE_RESOLUTIONS)}"}), 400
+        return Response(timeline.sparkline(resolution), mimetype='image/svg+xml')
+
+    @app.route('/api/users')
+    def api_users():
+        return jsonify(presence.snapshot())
+
+    @app.route('/api/users/<user_id>/history')
+    def api_user_history(user_id):
+        history = presence.history(user_id)
+        if history is None:
+            return jsonify({'error': 'unknown user'}), 404
+        return jsonify(history)
+
+    @app.route('/api/mqtt')
+    def api_mqtt():
+        session = mqtt_client
+        return jsonify(session.snapshot() if session else {'enabled': False})
+
+    @app.route('/api/metrics/animation')
+    def api_animation_metrics():
+        return jsonify(animation_snapshot() or {})
+
+    @app.route('/api/frame')
+    def api_frame():
+        frame = current_frame()
+        if frame is None:
+            return jsonify({'error': 'nothing shown yet'}), 404
+        width, height, pixels = frame
+        return jsonify({'width': width, 'height': height,
+                        'pixels': [pixels[i:i + 3].hex() for i in range(0, len(pixels), 3)]})
+
+    return app
+
+def history_with_durations(limit=HISTORY_API_ROWS):
+    """The last limit history entries with the seconds spent in each, and totals per status"""
+    with update_lock:
+        codes, times = status_history.columns(len(status_history) - limit)
+    statuses = HISTORY_STATUSES
+    now_us = int(time.time() * 1000000)
+    history = []
+    totals = {}
+    for i in range(len(codes)):
+        status = statuses[codes[i]]
+        end = times[i + 1] if i + 1 < len(times) else now_us
+        seconds = max(0, round((end - times[i]) / 1000000))
+        history.append({'status': status, 'timestamp': iso_from_us(times[i]), 'duration_seconds': seconds})
+        totals[status] = totals.get(status, 0) + seconds
+    return {'history': history, 'time_in_status': totals}
 
 def format_uptime(seconds):
     hours = int(seconds // 3600)
@@ -376,128 +2330,446 @@ def format_uptime(seconds):
 def rgb_to_hex(rgb):
     return '#{:02x}{:02x}{:02x}'.format(*rgb)
 
-def run_flask():
-    if CONFIG['web']['enabled']:
-        # Suppress Flask's default startup messages
-        import logging
-        log = logging.getLogger('werkzeug')
-        log.setLevel(logging.ERROR)
-        app.run(host=CONFIG['web']['host'], port=CONFIG['web']['port'], debug=False, use_reloader=False)
+def start_web_server():
+    """Bind the dashboard and serve it from a background thread.
+
+    The socket is bound before this returns, so the dashboard is reachable as
+    soon as startup continues - no fixed sleep waiting for Flask.
+    """
+    global web_server
+    # Suppress Flask's default request messages
+    import logging
+    from werkzeug.serving import make_server
+    log = logging.getLogger('werkzeug')
+    log.setLevel(logging.ERROR)
+    web_server = make_server(SETTINGS.web_host, SETTINGS.web_port, create_web_app(), threaded=True)
+    threading.Thread(target=web_server.serve_forever, args=(SERVE_POLL_INTERVAL,), daemon=True).start()
 
 # ============================================================================
 # PUSH NOTIFICATIONS
 # ============================================================================
 
-def send_notification(status, previous_status):
-    if not CONFIG['notifications']['enabled']:
+def send_notification(status, previous_status, trace=None):
+    settings = SETTINGS
+    if not settings.notify_enabled:
         return
-    if CONFIG['notifications']['only_on_change'] and status == previous_status:
+    if settings.notify_only_on_change and status == previous_status:
         return
 
     try:
+        import requests as http_requests  # Only loaded once notifications are used
+
         emoji = STATUS_EMOJI.get(status, '[??]')
         message = f"{emoji} Your Teams status is now: {status}"
-        ntfy_url = f"{CONFIG['notifications']['ntfy_server']}/{CONFIG['notifications']['ntfy_topic']}"
 
-        http_requests.post(
-            ntfy_url,
+        started = time.monotonic()
+        response = http_requests.post(
+            settings.ntfy_url,
             data=message.encode('utf-8'),
             headers={"Title": "Teams Status Changed", "Priority": "default", "Tags": "computer,teams"},
             timeout=5
         )
-        pass  # Notification sent silently
+        metrics.ntfy_seconds.observe(time.monotonic() - started)
+        if not response.ok:
+            metrics.ntfy_failures.inc()
+        tracer.mark(trace, 'ntfy_delivered', ok=response.ok)
     except Exception:
-        pass  # Silently ignore notification failures
+        metrics.ntfy_failures.inc()  # Counted in /metrics, never fatal
+        tracer.mark(trace, 'ntfy_delivered', ok=False)
 
 # ============================================================================
 # HOME ASSISTANT MQTT
 # ============================================================================
 
-def setup_mqtt():
-    global mqtt_client
-    if not CONFIG['homeassistant']['enabled']:
-        return None
+MQTT_BACKOFF_MIN = 1.0  # Seconds before the first reconnect attempt
+MQTT_BACKOFF_MAX = 60.0
+MQTT_RETAINED_TOPICS = 32  # Topics whose latest retained payload is kept for reconnects
 
-    mqtt_client = mqtt.Client()
-    if CONFIG['homeassistant']['mqtt_username']:
-        mqtt_client.username_pw_set(
-            CONFIG['homeassistant']['mqtt_username'],
-            CONFIG['homeassistant']['mqtt_password']
-        )
+class MqttSession:
+    """Broker session that outlives broker restarts.
 
-    mqtt_client.on_connect = on_mqtt_connect
-    try:
-        mqtt_client.connect(CONFIG['homeassistant']['mqtt_broker'], CONFIG['homeassistant']['mqtt_port'], 60)
-        mqtt_client.loop_start()
-        return mqtt_client
-    except Exception:
-        return None
+    A background thread connects, runs the paho network loop and reconnects
+    with jittered exponential backoff whenever the broker goes away. The
+    latest retained payload of each topic is kept: while disconnected,
+    publishes only update it, and every (re)connect re-announces discovery
+    and sends all of them in one burst.
+    """
 
-def on_mqtt_connect(client, userdata, flags, rc):
-    if rc == 0:
-        publish_ha_discovery()
+    def __init__(self, settings):
+        import paho.mqtt.client as mqtt
 
-def publish_ha_discovery():
-    if not mqtt_client:
-        return
-    discovery_topic = f"{CONFIG['homeassistant']['discovery_prefix']}/sensor/teams_presence/config"
-    payload = {
-        "name": "Teams Presence Status",
-        "unique_id": "teams_presence_status",
-        "state_topic": f"{CONFIG['homeassistant']['mqtt_topic']}/state",
-        "json_attributes_topic": f"{CONFIG['homeassistant']['mqtt_topic']}/attributes",
-        "icon": "mdi:microsoft-teams"
-    }
-    mqtt_client.publish(discovery_topic, json.dumps(payload), retain=True)
+        self.settings = settings
+        self.client = mqtt.Client()
+        if settings.mqtt_username:
+            self.client.username_pw_set(settings.mqtt_username, settings.mqtt_password)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.lock = threading.RLock()  # paho may call on_disconnect from inside publish()
+        self.retained = {}  # topic -> latest payload
+        self.pending = set()  # Topics published while disconnected, not sent yet
+        self.connected = False
+        self.connects = 0
+        self.backoff = MQTT_BACKOFF_MIN
+        self.stopping = threading.Event()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        """Connect, loop until the connection drops, wait out the backoff, repeat"""
+        settings = self.settings
+        while not self.stopping.is_set():
+            try:
+                self.client.connect(settings.mqtt_broker, settings.mqtt_port, 60)
+                while not self.stopping.is_set() and self.client.loop(timeout=1.0) == 0:
+                    pass
+            except (OSError, ValueError):
+                pass  # Broker unreachable or name not resolvable; retried below
+            self.on_disconnect(self.client, None, None)
+            # Equal jitter: clients restarted together do not reconnect in lockstep
+            self.stopping.wait(random.uniform(self.backoff / 2, self.backoff))
+            self.backoff = min(self.backoff * 2, MQTT_BACKOFF_MAX)
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            return
+        settings = self.settings
+        with self.lock:
+            self.connected = True
+            self.connects += 1
+            self.backoff = MQTT_BACKOFF_MIN
+            client.publish(settings.mqtt_discovery_topic, settings.mqtt_discovery_payload, retain=True)
+            for topic, payload in self.retained.items():
+                client.publish(topic, payload, retain=True)
+            self.pending.clear()
+
+    def on_disconnect(self, client, userdata, rc):
+        with self.lock:
+            self.connected = False
+
+    def publish(self, topic, payload):
+        """Publish a retained message; False if it is held until the next connect"""
+        with self.lock:
+            self.retained.pop(topic, None)
+            if len(self.retained) >= MQTT_RETAINED_TOPICS:
+                oldest = next(iter(self.retained))
+                del self.retained[oldest]
+                self.pending.discard(oldest)
+            self.retained[topic] = payload
+            if self.connected and self.client.publish(topic, payload, retain=True).rc == 0:
+                return True
+            self.pending.add(topic)
+            return False
+
+    def stop(self):
+        self.stopping.set()
+        with self.lock:
+            if self.connected:
+                self.client.disconnect()
 
-def publish_mqtt_status(status):
-    if not mqtt_client:
+    def snapshot(self):
+        with self.lock:
+            return {'connected': self.connected, 'connects': self.connects, 'buffered': len(self.pending)}
+
+def setup_mqtt():
+    global mqtt_client
+    if not SETTINGS.ha_enabled:
+        return None
+    mqtt_client = MqttSession(SETTINGS)
+    return mqtt_client
+
+def stop_mqtt():
+    global mqtt_client
+    session, mqtt_client = mqtt_client, None
+    if session:
+        session.stop()
+
+def publish_mqtt_status(status, trace=None):
+    session = mqtt_client
+    if not session:
         return
+    settings = session.settings
     try:
-        mqtt_client.publish(f"{CONFIG['homeassistant']['mqtt_topic']}/state", status, retain=True)
+        started = time.monotonic()
+        state_sent = session.publish(settings.mqtt_state_topic, status)
         attributes = {
             "emoji": STATUS_EMOJI.get(status, '[??]'),
             "color": rgb_to_hex(STATUS_COLORS.get(status, (255, 255, 255))),
             "uptime": format_uptime(current_status['uptime_seconds'])
         }
-        mqtt_client.publish(f"{CONFIG['homeassistant']['mqtt_topic']}/attributes", json.dumps(attributes), retain=True)
+        attributes_sent = session.publish(settings.mqtt_attributes_topic, json.dumps(attributes))
+        metrics.mqtt_seconds.observe(time.monotonic() - started)
+        ok = state_sent and attributes_sent
+        if not ok:
+            metrics.mqtt_failures.inc()
+        tracer.mark(trace, 'mqtt_published', ok=ok)
     except Exception:
-        pass  # Silently ignore MQTT publish failures
+        metrics.mqtt_failures.inc()  # Counted in /metrics, never fatal
+        tracer.mark(trace, 'mqtt_published', ok=False)
+
+# ============================================================================
+# TRAFFIC RECORDING (replayed by load_test.py)
+# ============================================================================
+
+def record_traffic(received_at, client_ip, data):
+    """Append one received POST /status to the record file as a JSON line"""
+    path = SETTINGS.record_file
+    if not path:
+        return
+    line = json.dumps({'t': received_at, 'client': client_ip, 'body': data}, separators=(',', ':'))
+    with open(path, 'a') as f:
+        f.write(line + "\n")
+
+# ============================================================================
+# SIDE-EFFECT DISPATCHER
+# ============================================================================
+
+def dispatch_side_effects():
+    """Run notifications and MQTT publishes queued by the receiver.
+
+    Keeps slow ntfy/MQTT round trips off the request path, so POST /status
+    answers as soon as the new state is in place.
+    """
+    while True:
+        func, args = side_effects.get()
+        try:
+            func(*args)
+        except Exception:
+            pass  # Each side effect records its own failures
+        finally:
+            side_effects.task_done()
 
 # ============================================================================
 # HTTP SERVER (RECEIVES STATUS FROM WORK PC)
 # ============================================================================
 
+def update_status(data, received, source=None):
+    """Apply one pushed status update.
+
+    Every update lands in the presence table under its user_id and device_id
+    (default: the sender's address); the user's merged status decides what is
+    shown. The primary user (no user_id, or board.primary_user) also drives
+    current_status, the single-status LED modes, ntfy and MQTT. Raises
+    ValueError for bad input.
+    """
+    settings = SETTINGS
+    if not isinstance(data, dict):
+        raise ValueError("status update must be a JSON object")
+    user_id = data.get("user_id") or settings.primary_user
+    device_id = data.get("device_id") or source or "default"
+    for name, value in (("user_id", user_id), ("device_id", device_id)):
+        if not isinstance(value, str) or len(value) > MAX_USER_ID_LENGTH:
+            raise ValueError(f"{name} must be a string of at most {MAX_USER_ID_LENGTH} characters")
+    new_status = data.get("availability", "Unknown")
+    if not isinstance(new_status, str) or new_status not in STATUS_COLORS:
+        raise ValueError(f"availability must be one of: {', '.join(STATUS_COLORS)}")
+    changed_at = client_time(data.get("changed_at")) or datetime.now().isoformat()
+
+    with update_lock:
+        result = presence.update(user_id, device_id, new_status, changed_at, received)
+        if result is not None:
+            apply_presence_change(user_id, result[0], data, received, changed_at)
+
+def client_time(value):
+    """A client-reported ISO time as local naive ISO like the server's own, or None.
+
+    Times with an offset are converted to local time; times in the future
+    (beyond a little clock skew) are rejected.
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    if moment > datetime.now() + MAX_CLIENT_CLOCK_SKEW:
+        return None
+    return moment.isoformat()
+
+def backfill_history(data):
+    """Merge transitions a client logged while it could not push; returns how many were valid.
+
+    Only history is touched: the live status comes from regular pushes, so
+    nothing is shown, notified or published for backfilled entries.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("transitions"), list):
+        raise ValueError("expected {\"transitions\": [...]}")
+    if len(data["transitions"]) > MAX_BACKFILL:
+        raise ValueError(f"at most {MAX_BACKFILL} transitions per request")
+    user_id = data.get("user_id") or SETTINGS.primary_user
+    if not isinstance(user_id, str) or len(user_id) > MAX_USER_ID_LENGTH:
+        raise ValueError(f"user_id must be a string of at most {MAX_USER_ID_LENGTH} characters")
+    entries = []
+    for transition in data["transitions"]:
+        if isinstance(transition, dict) and transition.get("availability") in STATUS_COLORS:
+            timestamp = client_time(transition.get("at"))
+            if timestamp:
+                entries.append((transition["availability"], timestamp))
+
+    with update_lock:
+        presence.backfill(user_id, entries)
+        if user_id == SETTINGS.primary_user:
+            added = status_history.merge([(status, epoch_us(timestamp)) for status, timestamp in entries])
+            for status, changed_us in added:
+                timeline.add(changed_us / 1000000, status)
+    return len(entries)
+
+def apply_presence_change(user_id, new_status, data, received, changed_at=None):
+    """React to a change in a user's merged status"""
+    global status_change
+    if user_id != SETTINGS.primary_user:
+        if SETTINGS.animation_mode == 'board':  # Other modes only show the primary user
+            status_change = (received, None)
+            status_event.set()  # Redraw the board
+        return
+
+    previous_status = current_status['availability']
+    if new_status == previous_status:
+        return
+
+    emoji = STATUS_EMOJI.get(new_status, '[??]')
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"\n  {timestamp}  {emoji}  Status: {new_status}")
+    current_status['availability'] = new_status
+    current_status['timestamp'] = datetime.now().isoformat()
+    # A client's changed_at may predate the last recorded change (clock skew, slow
+    # push) or the server start (stale clock); clamp it so history stays in time
+    # order and durations never go negative
+    now_us = epoch_us(current_status['timestamp'])
+    changed_us = min(epoch_us(changed_at), now_us) if changed_at else now_us
+    last = next(reversed(status_history), None)
+    changed_us = max(changed_us, server_started_us, last[1] if last is not None else 0)
+    current_status['last_change'] = iso_from_us(changed_us)
+    trace = tracer.start(data, new_status, received)
+    tracer.mark(trace, 'state_swapped')
+    status_change = (received, trace)
+    status_event.set()
+
+    status_history.append(new_status, changed_us)
+    timeline.add(changed_us / 1000000, new_status)
+
+    side_effects.put((send_notification, (new_status, previous_status, trace)))
+    side_effects.put((publish_mqtt_status, (new_status, trace)))
+
+def presence_sweeper():
+    """Drop silent devices out of their user's merged status"""
+    while not shutdown_flag:
+        time.sleep(PRESENCE_SWEEP_INTERVAL)
+        now = time.monotonic()
+        try:
+            with update_lock:
+                for user_id, merged, _ in presence.sweep(now):
+                    apply_presence_change(user_id, merged, {}, now)
+        except Exception as e:
+            print(f"  [!!] Presence sweep failed: {e}")  # Retried on the next sweep
+
+MAX_RATE_CLIENTS = 256  # Client addresses tracked by the rate limiter
+
+class RateLimiter:
+    """Token bucket per client address, with per-client request counts.
+
+    Each address may send server.rate_burst POSTs at once and
+    server.rate_limit per second after that. Only the (single-threaded)
+    HTTP server uses it, so it takes no lock. The least recently seen
+    address is forgotten once MAX_RATE_CLIENTS are tracked.
+    """
+
+    def __init__(self):
+        self.clients = {}  # address -> [tokens, last refill, allowed, limited]
+
+    def check(self, address, now):
+        """0 if the request may proceed, else seconds until it would"""
+        settings = SETTINGS
+        client = self.clients.pop(address, None)
+        if client is None:
+            if len(self.clients) >= MAX_RATE_CLIENTS:
+                del self.clients[next(iter(self.clients))]
+            client = [settings.rate_burst, now, 0, 0]
+        self.clients[address] = client
+        client[0] = min(settings.rate_burst, client[0] + (now - client[1]) * settings.rate_limit)
+        client[1] = now
+        if client[0] >= 1:
+            client[0] -= 1
+            client[2] += 1
+            return 0
+        client[3] += 1
+        return (1 - client[0]) / settings.rate_limit
+
+    def counts(self):
+        """[(address, allowed, limited)]"""
+        return [(address, client[2], client[3]) for address, client in list(self.clients.items())]
+
+rate_limiter = RateLimiter()
+
 class TeamsStatusHandler(BaseHTTPRequestHandler):
+    response_code = 0
+
+    def setup(self):
+        self.timeout = SETTINGS.read_timeout  # Applied to the socket; a stalled client cannot hold the receiver
+        super().setup()
+
     def log_message(self, format, *args):
-        # Suppress default HTTP logging - we handle status changes ourselves
+        # Suppress default HTTP logging - requests are counted in /metrics instead
         pass
 
+    def send_response(self, code, message=None):
+        self.response_code = code
+        super().send_response(code, message)
+
+    def read_body(self, received):
+        """The POST body, or None if it was refused (411/413/429) or not sent in time"""
+        retry_after = rate_limiter.check(self.client_address[0], received)
+        if retry_after:
+            self.reject(429, "too many requests", {'Retry-After': str(math.ceil(retry_after))})
+            return None
+        try:
+            content_length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.reject(411, "Content-Length required")
+            return None
+        if not 0 <= content_length <= SETTINGS.max_body:
+            self.reject(413, f"body larger than {SETTINGS.max_body} bytes")
+            return None
+        try:
+            body = self.rfile.read(content_length)
+        except OSError:  # Includes the server.read_timeout expiring
+            body = b''
+        if len(body) < content_length:
+            self.response_code = 408  # Counted only; the client is gone or stalled
+            self.close_connection = True
+            return None
+        return body
+
+    def reject(self, code, error, headers=None):
+        """Answer with a JSON error and close the connection (the body is left unread)"""
+        body = json.dumps({"error": error}).encode('utf-8')
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
     def do_POST(self):
         """Receive status update from work PC"""
-        if self.path == "/status":
+        received = time.monotonic()
+        post_data = None
+        if self.path not in ("/status", "/history"):
+            self.send_response(404)
+            self.end_headers()
+        else:
+            post_data = self.read_body(received)
+        if post_data is None:
+            pass  # Already answered
+        elif self.path == "/status":
             try:
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
                 data = json.loads(post_data.decode('utf-8'))
-
-                new_status = data.get("availability", "Unknown")
-                previous_status = current_status['availability']
-
-                if new_status != previous_status:
-                    emoji = STATUS_EMOJI.get(new_status, '[??]')
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    print(f"\n  {timestamp}  {emoji}  Status: {new_status}")
-                    current_status['availability'] = new_status
-                    current_status['timestamp'] = datetime.now().isoformat()
-                    current_status['last_change'] = datetime.now().isoformat()
-
-                    status_history.append({'status': new_status, 'timestamp': current_status['timestamp']})
-                    if len(status_history) > MAX_HISTORY:
-                        status_history.pop(0)
-
-                    send_notification(new_status, previous_status)
-                    publish_mqtt_status(new_status)
+                if SETTINGS.record_file:
+                    side_effects.put((record_traffic, (time.time(), self.client_address[0], data)))
+                update_status(data, received, self.client_address[0])
 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -506,9 +2778,20 @@ class TeamsStatusHandler(BaseHTTPRequestHandler):
             except Exception:
                 self.send_response(400)
                 self.end_headers()
+            metrics.status_post_seconds.observe(time.monotonic() - received)
         else:
-            self.send_response(404)
-            self.end_headers()
+            try:
+                data = json.loads(post_data.decode('utf-8'))
+                accepted = backfill_history(data)
+
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({"status": "ok", "accepted": accepted}).encode('utf-8'))
+            except Exception:
+                self.send_response(400)
+                self.end_headers()
+        metrics.count_request('POST', self.path, self.response_code)
 
     def do_GET(self):
         """Status check endpoint"""
@@ -527,18 +2810,284 @@ class TeamsStatusHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'application/json')
             self.end_headers()
             self.wfile.write(json.dumps(current_status).encode('utf-8'))
+        elif self.path == "/users":
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(presence.snapshot()).encode('utf-8'))
+        elif self.path == "/metrics":
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         else:
             self.send_response(404)
             self.end_headers()
+        metrics.count_request('GET', self.path, self.response_code)
+
+# ============================================================================
+# UDP RECEIVER (COMPACT PUSH TRANSPORT)
+# ============================================================================
+#
+# One datagram per status change: an 8-byte HMAC-SHA256 (server.udp_key) of
+# the body, then the body itself - the POST /status JSON plus "client" (sender
+# ID) and "seq" (increasing per client). Authentic datagrams are acked with the
+# same framing around {"ack": seq} once applied (rejected updates are not
+# acked); senders retry until acked.
+
+UDP_MAC_SIZE = 8
+UDP_MAX_DATAGRAM = 2048
+MAX_UDP_CLIENTS = 256  # Sequence numbers remembered; the oldest client is forgotten first
+udp_sequences = {}  # client -> last applied seq (receiver thread only)
+
+def udp_mac(body):
+    return hmac.new(SETTINGS.udp_key, body, hashlib.sha256).digest()[:UDP_MAC_SIZE]
+
+def udp_receiver(sock):
+    """Apply status datagrams; duplicates and out-of-order packets are acked but not applied"""
+    while not shutdown_flag:
+        try:
+            packet, address = sock.recvfrom(UDP_MAX_DATAGRAM)
+        except OSError:
+            return  # Socket closed on shutdown
+        received = time.monotonic()
+        mac, body = packet[:UDP_MAC_SIZE], packet[UDP_MAC_SIZE:]
+        if not hmac.compare_digest(mac, udp_mac(body)):
+            metrics.count_udp('bad_mac')
+            continue
+        try:
+            data = json.loads(body.decode('utf-8'))
+            client, seq = str(data['client']), int(data['seq'])
+        except (ValueError, KeyError, TypeError):
+            metrics.count_udp('malformed')
+            continue
+
+        last = udp_sequences.get(client)
+        if last is not None and seq <= last:
+            metrics.count_udp('duplicate')
+        else:
+            if SETTINGS.record_file:
+                side_effects.put((record_traffic, (time.time(), address[0], data)))
+            try:
+                update_status(data, received, address[0])
+            except Exception:
+                metrics.count_udp('rejected')
+                continue  # No ack and seq not recorded: a retry is applied (or rejected) again
+            udp_sequences.pop(client, None)
+            if len(udp_sequences) >= MAX_UDP_CLIENTS:
+                del udp_sequences[next(iter(udp_sequences))]
+            udp_sequences[client] = seq
+            metrics.count_udp('accepted')
+
+        ack = json.dumps({'ack': seq}, separators=(',', ':')).encode('utf-8')
+        try:
+            sock.sendto(udp_mac(ack) + ack, address)
+        except OSError:
+            pass
+
+# ============================================================================
+# CONFIG HOT-RELOAD
+# ============================================================================
+
+def config_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+def reload_settings():
+    """Load and validate the config file, swap it in and apply the changes"""
+    global SETTINGS
+    try:
+        new = Settings(load_config())
+    except (TypeError, ValueError, yaml.YAMLError) as e:
+        print(f"\n  [!!] Config not reloaded, keeping previous settings: {e}")
+        return False
+
+    old = SETTINGS
+    SETTINGS = new
+
+    # Animation picks up brightness/mode/transition at its next cycle
+    status_event.set()
+    # ntfy reads SETTINGS on every send; MQTT needs a new session for new broker/topics
+    if new.mqtt_key() != old.mqtt_key():
+        stop_mqtt()
+        if setup_mqtt():
+            side_effects.put((publish_mqtt_status, (current_status['availability'],)))  # Sent on connect
+    restart_needed = [name for name in ('server_port', 'udp_port', 'web_enabled', 'web_host', 'web_port',
+                                        'display_backend', 'capture_file', 'renderer')
+                      if getattr(new, name) != getattr(old, name)]
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    print(f"\n  {timestamp}  [OK]  Config reloaded")
+    if restart_needed:
+        print(f"  [--] Restart required to apply: {', '.join(restart_needed)}")
+    return True
+
+def config_watcher():
+    """Poll the config file and hot-reload it when it changes"""
+    path = get_config_path()
+    signature = config_signature(path)
+    while not shutdown_flag:
+        time.sleep(CONFIG_POLL_INTERVAL)
+        current = config_signature(path)
+        if current != signature:
+            signature = current
+            if current is not None:
+                reload_settings()
+
+# ============================================================================
+# LIFECYCLE (BOUNDED SHUTDOWN, HISTORY ACROSS RESTARTS)
+# ============================================================================
+
+SHUTDOWN_RESERVE = 0.5  # Seconds of server.shutdown_timeout kept for saving history and blanking the LEDs
+
+def signal_handler(sig, frame):
+    """SIGINT/SIGTERM: stop the receiver; main() then runs shutdown().
+
+    The handler runs on the main thread, which is inside serve_forever(), so
+    httpd.shutdown() (which waits for serve_forever to return) has to be
+    called from another thread. A second signal exits immediately.
+    """
+    global shutdown_started
+    if shutdown_started is not None:
+        os._exit(1)
+    shutdown_started = time.monotonic()
+    print("\n\n  Shutting down...")
+    if httpd is None:
+        sys.exit(0)  # Nothing running yet
+    threading.Thread(target=httpd.shutdown, daemon=True).start()
+
+def shutdown():
+    """Stop intake, drain side effects, save history and blank the LEDs.
+
+    Bounded by server.shutdown_timeout: queued ntfy/MQTT work gets whatever
+    time is left before the last SHUTDOWN_RESERVE seconds, and a watchdog
+    ends the process at the deadline if any step hangs.
+    """
+    global shutdown_flag
+    started = shutdown_started or time.monotonic()
+    deadline = started + SETTINGS.shutdown_timeout
+    watchdog = threading.Timer(max(0, deadline - time.monotonic()), shutdown_expired)
+    watchdog.daemon = True
+    watchdog.start()
+
+    # No new work: close the receivers
+    httpd.server_close()
+    if udp_sock:
+        udp_sock.close()
+    if web_server:
+        web_server.shutdown()
+
+    dropped = drain_side_effects(deadline - SHUTDOWN_RESERVE)
+    stop_mqtt()
+    tracer.flush()
+    save_history()
+
+    shutdown_flag = True
+    status_event.set()
+    if renderer:
+        renderer.stop(deadline)
+    else:
+        if animation_thread:
+            animation_thread.join(max(0, deadline - time.monotonic()))
+        clear_display()
+        display.backend.close()
+    watchdog.cancel()
+
+    elapsed_ms = (time.monotonic() - started) * 1000
+    print(f"  [OK] Stopped in {elapsed_ms:.0f}ms" + (f" ({dropped} notifications/publishes dropped)" if dropped else ""))
+
+def shutdown_expired():
+    """Watchdog: the shutdown overran server.shutdown_timeout"""
+    print("  [!!] Shutdown timed out, exiting")
+    os._exit(1)
+
+def drain_side_effects(deadline):
+    """Wait until the dispatcher has run everything queued; returns how many were still pending at deadline"""
+    with side_effects.all_tasks_done:
+        while side_effects.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            side_effects.all_tasks_done.wait(remaining)
+        return side_effects.unfinished_tasks
+
+def save_history():
+    """Write status_history to server.history_file (replaced atomically)"""
+    path = SETTINGS.history_file
+    if not path:
+        return
+    tmp = path + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump({'stopped_at': datetime.now().isoformat(), 'history': status_history.entries()}, f,
+                      separators=(',', ':'))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"  [!!] History not saved: {e}")
+
+def load_history():
+    """Restore the status history (and timeline) saved by the previous run.
+
+    The time the server was down shows as Unknown on the timeline.
+    """
+    path = SETTINGS.history_file
+    if not path:
+        return
+    try:
+        with open(path, 'r') as f:
+            saved = json.load(f)
+        entries = saved['history'][-MAX_HISTORY:]
+        stopped_at = client_time(saved.get('stopped_at'))
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"  [!!] History not restored from {path}: {e}")
+        return
+    latest_us = int((time.time() + MAX_CLIENT_CLOCK_SKEW.total_seconds()) * 1000000)
+    for entry in entries:  # [status, epoch microseconds]
+        if (isinstance(entry, list) and len(entry) == 2 and isinstance(entry[0], str) and entry[0] in STATUS_COLORS
+                and isinstance(entry[1], int) and entry[1] <= latest_us):
+            status_history.append(entry[0], entry[1])
+            timeline.add(entry[1] / 1000000, entry[0])
+    if stopped_at and status_history:
+        timeline.add(datetime.fromisoformat(stopped_at).timestamp(), 'Unknown')
 
 # ============================================================================
 # MAIN
 # ============================================================================
 
+def notify_ready():
+    """Tell systemd (Type=notify) that the receiver is accepting connections"""
+    notify_socket = os.environ.get('NOTIFY_SOCKET')
+    if not notify_socket:
+        return
+    if notify_socket.startswith('@'):
+        notify_socket = '\0' + notify_socket[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'READY=1', notify_socket)
+    except OSError:
+        pass  # Not fatal - systemd falls back to its start timeout
+
 def main():
-    global animation_thread, httpd
+    global animation_thread, httpd, udp_sock, renderer
 
+    started = time.monotonic()
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    # Bind the status receiver before anything else so pushes are never refused;
+    # connections queue in the listen backlog until serve_forever() picks them up
+    server_address = ('', SETTINGS.server_port)
+    httpd = HTTPServer(server_address, TeamsStatusHandler)
+    if SETTINGS.udp_port:
+        udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_sock.bind(('', SETTINGS.udp_port))
+    load_history()
 
     # Clear screen and show banner
     print("\033c", end="")  # Clear terminal
@@ -550,50 +3099,61 @@ def main():
     print("  +--------------------------------------------------------------------+")
     print("  |  Configuration                                                     |")
     print("  +--------------------------------------------------------------------+")
-    port_str = str(CONFIG['server']['port']).ljust(10)
-    web_status = "Enabled" if CONFIG['web']['enabled'] else "Disabled"
-    web_str = f":{CONFIG['web']['port']}" if CONFIG['web']['enabled'] else ""
+    port_str = str(SETTINGS.server_port).ljust(10)
+    web_status = "Enabled" if SETTINGS.web_enabled else "Disabled"
+    web_str = f":{SETTINGS.web_port}" if SETTINGS.web_enabled else ""
     print(f"  |  Status Server Port: {port_str}  Web Dashboard: {web_status}{web_str.ljust(15)}|")
-    notif_status = "Enabled" if CONFIG['notifications']['enabled'] else "Disabled"
-    ha_status = "Enabled" if CONFIG['homeassistant']['enabled'] else "Disabled"
+    if SETTINGS.udp_port:
+        print(f"  |  UDP Push Port: {str(SETTINGS.udp_port).ljust(50)}|")
+    notif_status = "Enabled" if SETTINGS.notify_enabled else "Disabled"
+    ha_status = "Enabled" if SETTINGS.ha_enabled else "Disabled"
     print(f"  |  Notifications: {notif_status.ljust(12)}  Home Assistant: {ha_status.ljust(15)}|")
+
+    if SETTINGS.renderer == 'process':
+        # Forked before any other thread exists; the child opens the display
+        renderer = RendererProcess()
+        print(f"  |  Display: {f'renderer process (pid {renderer.process.pid})'.ljust(57)}|")
+    else:
+        setup_unicorn()
+        print(f"  |  Display: {display.backend.name.ljust(57)}|")
     print("  +--------------------------------------------------------------------+")
     print()
 
-    setup_unicorn()
-    startup_animation()
+    # Notifications and MQTT publishes run off the request path
+    threading.Thread(target=dispatch_side_effects, daemon=True).start()
+    threading.Thread(target=presence_sweeper, daemon=True).start()
+    if udp_sock:
+        threading.Thread(target=udp_receiver, args=(udp_sock,), daemon=True).start()
 
-    # Start animation thread
-    animation_thread = threading.Thread(target=animation_loop, daemon=True)
-    animation_thread.start()
+    # Startup animation plays on the display thread while the rest starts up
+    if not renderer:
+        animation_thread = threading.Thread(target=display_thread, daemon=True)
+        animation_thread.start()
 
     # Start web dashboard
-    if CONFIG['web']['enabled']:
-        web_thread = threading.Thread(target=run_flask, daemon=True)
-        web_thread.start()
-        time.sleep(2)
+    if SETTINGS.web_enabled:
+        start_web_server()
 
     # Setup Home Assistant
-    if CONFIG['homeassistant']['enabled']:
+    if SETTINGS.ha_enabled:
         setup_mqtt()
 
-    # Start HTTP server
-    server_address = ('', CONFIG['server']['port'])
-    httpd = HTTPServer(server_address, TeamsStatusHandler)
+    # Pick up config edits without a restart
+    threading.Thread(target=config_watcher, daemon=True).start()
+
+    notify_ready()
+    ready_ms = (time.monotonic() - started) * 1000
 
     print("  --------------------------------------------------------------------")
-    print("  [OK] Server ready! Waiting for status updates...")
+    print(f"  [OK] Server ready in {ready_ms:.0f}ms! Waiting for status updates...")
     print("  Press Ctrl+C to stop")
     print("  --------------------------------------------------------------------")
     print()
 
     try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        pass
+        httpd.serve_forever(SERVE_POLL_INTERVAL)
     finally:
-        httpd.shutdown()
-        clear_display()
+        shutdown()
 
 if __name__ == "__main__":
     main()
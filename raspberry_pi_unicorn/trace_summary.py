@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+MS Teams Presence - Trace summary
+Prints latency percentiles per stage from the server's traces.jsonl
+
+Stages (milliseconds):
+  scan_ms            client: reading the Teams log (get_teams_status)
+  detect_to_push_ms  client: status detected -> POST sent
+  network_ms         client push -> Pi receive (wall clocks, includes clock skew)
+  state_swapped      Pi: POST received -> new status in place
+  first_frame        Pi: POST received -> first LED frame with the new status
+  mqtt_published     Pi: POST received -> MQTT publish done
+  ntfy_delivered     Pi: POST received -> ntfy notification delivered
+  log_to_led         detect_to_push_ms + network_ms + first_frame
+"""
+
+import argparse
+import json
+import math
+import os
+
+DEFAULT_TRACE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces.jsonl")
+CLIENT_STAGES = ("scan_ms", "detect_to_push_ms", "network_ms")
+SERVER_STAGES = ("state_swapped", "first_frame", "mqtt_published", "ntfy_delivered")
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def load_stages(path: str) -> dict:
+    """Collect per-stage samples from a trace file."""
+    stages = {name: [] for name in CLIENT_STAGES + SERVER_STAGES + ("log_to_led",)}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            client = record.get("client", {})
+            server = record.get("server", {})
+            failed = set(record.get("failed", []))
+            for name in CLIENT_STAGES:
+                if name in client:
+                    stages[name].append(client[name])
+            for name in SERVER_STAGES:
+                if name in server and name not in failed:
+                    stages[name].append(server[name])
+            if all(name in client for name in ("detect_to_push_ms", "network_ms")) and "first_frame" in server:
+                stages["log_to_led"].append(client["detect_to_push_ms"] + client["network_ms"] + server["first_frame"])
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize status-change traces")
+    parser.add_argument("file", nargs="?", default=DEFAULT_TRACE_FILE, help="Trace file (default: traces.jsonl)")
+    args = parser.parse_args()
+
+    stages = load_stages(args.file)
+    print(f"  {'stage'.ljust(20)}{'count'.rjust(7)}{'p50'.rjust(10)}{'p90'.rjust(10)}{'p99'.rjust(10)}{'max'.rjust(10)}")
+    for name, values in stages.items():
+        if not values:
+            continue
+        values.sort()
+        print(f"  {name.ljust(20)}{str(len(values)).rjust(7)}"
+              f"{percentile(values, 50):10.1f}{percentile(values, 90):10.1f}"
+              f"{percentile(values, 99):10.1f}{values[-1]:10.1f}")
+
+
+if __name__ == "__main__":
+    main()